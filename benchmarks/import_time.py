@@ -0,0 +1,97 @@
+"""Measures the cost of `import pydaemo` in a fresh interpreter.
+
+Usage:
+  python benchmarks/import_time.py --runs 20 --history import_time.jsonl
+
+Each run starts a new interpreter, so the numbers include the cold import of
+every module pydaemo pulls in. The cost of starting an empty interpreter is
+measured the same way and subtracted. With `--history`, the result is
+appended to a JSONL file so that it can be compared across releases.
+"""
+
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_command(code, runs):
+  """Times `python -c code` in fresh interpreters.
+
+  Args:
+    code: The python code to run.
+    runs: The number of interpreters to start.
+
+  Returns:
+    A list of wall times in seconds.
+  """
+  env = dict(os.environ, PYTHONPATH=ROOT)
+  times = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, '-c', code], env=env)
+    times.append(time.perf_counter() - start)
+  return times
+
+
+def slowest_imports(code, count):
+  """Lists the modules that take the longest to import, using -X importtime.
+
+  Requires python 3.7 or later.
+
+  Args:
+    code: The python code to run.
+    count: The number of modules to return.
+
+  Returns:
+    A list of (cumulative microseconds, module name) pairs.
+  """
+  env = dict(os.environ, PYTHONPATH=ROOT)
+  proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                        env=env, stderr=subprocess.PIPE,
+                        universal_newlines=True, check=True)
+  modules = []
+  for line in proc.stderr.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    modules.append((int(cumulative), name.strip()))
+  return sorted(modules, reverse=True)[:count]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--runs', type=int, default=20)
+  parser.add_argument('--statement', default='import pydaemo')
+  parser.add_argument('--history', help='JSONL file to append the result to')
+  args = parser.parse_args()
+
+  baseline = statistics.median(time_command('pass', args.runs))
+  total = statistics.median(time_command(args.statement, args.runs))
+  sys.path.insert(0, ROOT)
+  import pydaemo
+  result = {'version': pydaemo.__version__,
+            'python': '.'.join(str(v) for v in sys.version_info[:3]),
+            'statement': args.statement,
+            'runs': args.runs,
+            'median_ms': round(1000 * (total - baseline), 2),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+  print(json.dumps(result))
+  # -X importtime only exists on python 3.7 and later.
+  if sys.version_info >= (3, 7):
+    for cumulative, name in slowest_imports(args.statement, 10):
+      print('{:>10.2f} ms  {}'.format(cumulative / 1000, name))
+  if args.history:
+    with open(args.history, 'a') as f:
+      f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+  main()
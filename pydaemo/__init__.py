@@ -1 +1,11 @@
+"""Python wrapper for Daemo: a crowdsourcing platform.
+
+`requests` and the optional features are only imported when first used, so
+`import pydaemo` stays cheap for short-lived processes.
+"""
+
+
+__version__ = '0.1'
+
 from .api import *
+from .clone import clone_project
@@ -0,0 +1,213 @@
+"""Throughput analytics computed from assignment timestamps.
+
+All the computations are vectorized with numpy, so hundreds of thousands of
+assignments (as returned by `Daemo.get_assignments` or read from a local
+mirror) are processed in well under a few seconds:
+
+  throughput = Throughput(assignments, tasks=daemo.get_all_tasks(project_id))
+  print(summarize(throughput.time_to_submit()))
+  print(throughput.forecast(remaining=1000))
+"""
+
+
+from datetime import datetime
+from datetime import timezone
+
+import numpy as np
+
+
+def _normalize(value):
+  """Splits a timestamp into a naive ISO 8601 string numpy can parse and its
+  UTC offset in minutes.
+  """
+  if value is None or value == '':
+    return 'NaT', 0
+  if isinstance(value, datetime):
+    if value.tzinfo is not None:
+      value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(), 0
+  if value.endswith('Z'):
+    return value[:-1], 0
+  if len(value) > 6 and value[-6] in '+-' and value[-3] == ':':
+    minutes = int(value[-5:-3]) * 60 + int(value[-2:])
+    return value[:-6], minutes if value[-6] == '+' else -minutes
+  return value, 0
+
+
+def to_seconds(values):
+  """Converts timestamps to seconds since the epoch.
+
+  Args:
+    values: A list of ISO 8601 strings, datetimes or None.
+
+  Returns:
+    A float numpy array, with nan for missing timestamps.
+  """
+  if len(values) == 0:
+    return np.zeros(0)
+  normalized, offsets = zip(*[_normalize(value) for value in values])
+  missing = np.array([value == 'NaT' for value in normalized], dtype=bool)
+  times = np.array(normalized, dtype='datetime64[us]')
+  seconds = (times - np.datetime64(0, 'us')).astype(np.float64) / 1e6
+  # The UTC offsets are applied to all the timestamps at once.
+  seconds -= 60 * np.array(offsets, dtype=np.float64)
+  seconds[missing] = np.nan
+  return seconds
+
+
+def summarize(values, percentiles=(50, 90, 99)):
+  """Summarizes a distribution of durations.
+
+  Args:
+    values: A numpy array of durations in seconds; nan values are ignored.
+    percentiles: The percentiles to report.
+
+  Returns:
+    An object containing 'count', 'mean', 'min', 'max' and one 'p<N>' entry
+    per percentile.
+  """
+  values = values[~np.isnan(values)]
+  summary = {'count': int(values.size)}
+  if values.size == 0:
+    return summary
+  summary['mean'] = float(values.mean())
+  summary['min'] = float(values.min())
+  summary['max'] = float(values.max())
+  for percentile, value in zip(percentiles,
+                               np.percentile(values, percentiles)):
+    summary['p' + str(percentile)] = float(value)
+  return summary
+
+
+class Throughput(object):
+  """Distributions of how fast the crowd completes the tasks of a project.
+  """
+
+  def __init__(self, assignments, tasks=None, task_field='task',
+               worker_field='worker', accepted_field='created_at',
+               submitted_field='submitted_at', task_created_field='created_at'):
+    """Constructor for Throughput.
+
+    Args:
+      assignments: A list of assignment resources.
+      tasks: Optional list of task resources, used to know when each task
+        was created. Without it, time to accept is not available and
+        turnaround is measured from the first accepted assignment.
+      task_field: The assignment field containing the task id.
+      worker_field: The assignment field containing the worker id.
+      accepted_field: The assignment field with the time it was accepted.
+      submitted_field: The assignment field with the time it was submitted.
+      task_created_field: The task field with the time it was created.
+    """
+    self.task = np.array([a.get(task_field) for a in assignments])
+    self.worker = np.array([a.get(worker_field) for a in assignments])
+    # Assignments without a task or worker id are left out of the per task
+    # and per worker computations, since None cannot be sorted with ids.
+    self.has_task = np.array([a.get(task_field) is not None
+                              for a in assignments], dtype=bool)
+    self.has_worker = np.array([a.get(worker_field) is not None
+                                for a in assignments], dtype=bool)
+    self.accepted = to_seconds([a.get(accepted_field) for a in assignments])
+    self.submitted = to_seconds([a.get(submitted_field) for a in assignments])
+    self.task_created = np.full(len(assignments), np.nan)
+    if tasks is not None:
+      created = dict(zip([t['id'] for t in tasks],
+                         to_seconds([t.get(task_created_field)
+                                     for t in tasks])))
+      self.task_created = np.array(
+          [created.get(task, np.nan) for task in self.task.tolist()],
+          dtype=np.float64)
+
+  def time_to_accept(self):
+    """Returns the seconds between the creation of a task and each accept.
+    """
+    return self.accepted - self.task_created
+
+  def time_to_submit(self):
+    """Returns the seconds each assignment took from accept to submit.
+    """
+    return self.submitted - self.accepted
+
+  def turnaround(self):
+    """Computes how long each task took to get all of its results.
+
+    Returns:
+      A pair of numpy arrays: the task ids and their turnaround in seconds,
+      nan for tasks without any submitted assignment.
+    """
+    tasks, inverse = np.unique(self.task[self.has_task], return_inverse=True)
+    start = np.where(np.isnan(self.task_created), self.accepted,
+                     self.task_created)
+    first = np.full(tasks.size, np.nan)
+    last = np.full(tasks.size, np.nan)
+    np.fmin.at(first, inverse, start[self.has_task])
+    np.fmax.at(last, inverse, self.submitted[self.has_task])
+    return tasks, last - first
+
+  def arrival_rate(self, bin_seconds=3600):
+    """Computes how many assignments were submitted over time.
+
+    Args:
+      bin_seconds: The width of each time bin.
+
+    Returns:
+      A pair of numpy arrays: the start of each bin in seconds since the
+      epoch and the number of submissions per second in that bin.
+    """
+    submitted = self.submitted[~np.isnan(self.submitted)]
+    if submitted.size == 0:
+      return np.zeros(0), np.zeros(0)
+    start = np.floor(submitted.min() / bin_seconds) * bin_seconds
+    counts = np.bincount(((submitted - start) // bin_seconds).astype(np.int64))
+    return start + bin_seconds * np.arange(counts.size), counts / bin_seconds
+
+  def worker_speed(self):
+    """Computes how fast each worker submits assignments.
+
+    Returns:
+      An object containing numpy arrays 'worker', 'count', 'mean' and
+      'median' where the last two are times to submit in seconds.
+    """
+    durations = self.time_to_submit()
+    valid = ~np.isnan(durations) & self.has_worker
+    workers, inverse = np.unique(self.worker[valid], return_inverse=True)
+    durations = durations[valid]
+    counts = np.bincount(inverse, minlength=workers.size)
+    means = np.bincount(inverse, weights=durations,
+                        minlength=workers.size) / np.maximum(counts, 1)
+    # Sort by worker then duration to read each worker's median in place.
+    order = np.lexsort((durations, inverse))
+    sorted_durations = durations[order]
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    lower = offsets + (counts - 1) // 2
+    upper = offsets + counts // 2
+    medians = (sorted_durations[lower] + sorted_durations[upper]) / 2
+    return {'worker': workers, 'count': counts, 'mean': means,
+            'median': medians}
+
+  def forecast(self, remaining, window_seconds=3600, now=None):
+    """Forecasts when the remaining assignments will be completed.
+
+    The forecast assumes that the crowd keeps submitting at the rate observed
+    during the last `window_seconds`.
+
+    Args:
+      remaining: The number of assignments still to be submitted.
+      window_seconds: The width of the window used to measure the rate.
+      now: Optional current time in seconds since the epoch. Defaults to the
+        time of the last submission.
+
+    Returns:
+      An object containing 'rate' in submissions per second, 'seconds' left
+      and the 'completion' time in seconds since the epoch. The last two are
+      None if nothing was submitted during the window.
+    """
+    submitted = self.submitted[~np.isnan(self.submitted)]
+    if now is None:
+      now = float(submitted.max()) if submitted.size else 0.0
+    recent = np.count_nonzero(submitted > now - window_seconds)
+    rate = recent / float(window_seconds)
+    if rate == 0:
+      return {'rate': 0.0, 'seconds': None, 'completion': None}
+    seconds = remaining / rate
+    return {'rate': rate, 'seconds': seconds, 'completion': now + seconds}
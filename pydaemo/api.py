@@ -1,10 +1,21 @@
+"""The Daemo client.
+
+The modules behind the optional features (artifact downloads, the write
+spool and task validation) are only imported when those features are used.
+"""
+
+
+from .utils import bounded_map
 from .utils import create_header
 from .utils import delete
 from .utils import get
 from .utils import get_from_pages
+from .utils import get_template_id
+from .utils import iter_pages
 from .utils import load_credentials
 from .utils import save_credentials
 from .utils import post
+from .utils import resolve
 
 
 class Daemo(object):
@@ -12,7 +23,7 @@ class Daemo(object):
   """
 
   def __init__(self, credential_file='credentials.json', prod=False,
-               update_credentials=False):
+               update_credentials=False, spool_file=None, compress=False):
     """Constructor for Daemo.
 
     Args:
@@ -20,6 +31,11 @@ class Daemo(object):
         account.
       prod: Boolean that connects to production is True or sandbox if False.
       update_credentials: Boolean that refreshes the access_token if True.
+      spool_file: Optional path to a WriteSpool log. When set, the calls that
+        modify resources and cannot connect to Daemo are spooled to disk and
+        retried in the background; those calls return a future instead of
+        their result (see `resolve`).
+      compress: Boolean that gzips the body of the requests if True.
     """
     if prod:
       self.url = 'https://daemo.org'
@@ -30,7 +46,50 @@ class Daemo(object):
     if update_credentials:
       self._update_credentials()
       save_credentials(self.credentials, credential_file)
-    self.header = create_header(self.credentials)
+    self.header = create_header(self.credentials, compress=compress)
+    self._validators = {}
+    self.spool = None
+    if spool_file is not None:
+      from .spool import WriteSpool
+      self.spool = WriteSpool(spool_file, self.header)
+
+  def _write(self, method, url, data, verbose=False, transform=None):
+    """Sends a request that modifies a resource.
+
+    With a spool, the request is sent directly unless earlier writes are
+    still spooled, and it is spooled if Daemo cannot be connected to.
+
+    Args:
+      method: Either 'POST' or 'DELETE'.
+      url: The URL to send the request to.
+      data: The data accompanying the request.
+      verbose: Boolean that prints out helpful comments.
+      transform: Optional function applied to the response.
+
+    Returns:
+      The (transformed) response, or a future of it when it was spooled.
+    """
+    if self.spool is None or self.spool.pending() == 0:
+      try:
+        if method == 'DELETE':
+          delete(url, self.header)
+          return None
+        resp = post(url, data, self.header, verbose=verbose)
+      except Exception as e:
+        from .spool import is_connect_error
+        if self.spool is None or not is_connect_error(e):
+          raise
+        if verbose:
+          print('Daemo is unreachable, spooling', method, url)
+      else:
+        if transform is not None:
+          resp = transform(resp)
+        return resp
+    future = self.spool.submit(method, url, data)
+    if transform is not None:
+      from .spool import then
+      future = then(future, transform)
+    return future
 
   def _update_credentials(self):
     """Uses the refresh token to update the access token.
@@ -44,7 +103,8 @@ class Daemo(object):
     self.credentials['refresh_token'] = resp['refresh_token']
 
   def create_project(self, name, price, template_name,
-                     repetition=1, timeout=120, verbose=False):
+                     repetition=1, timeout=120, template_items=None,
+                     verbose=False):
     """Creates a new Daemo project.
 
     Args:
@@ -53,6 +113,8 @@ class Daemo(object):
       template_name: Name of the template to use.
       repetition: How many assignments the task should have.
       timeout: Maximum time allocated before expiring the task.
+      template_items: Optional list of template item resources that are
+        created along with the template.
       verbose: Boolean that prints out helpful comments.
 
     Returns:
@@ -67,9 +129,9 @@ class Daemo(object):
             'repetition': repetition,
             'timeout': timeout,
             'template': {'name': template_name,
-                         'items': []}}
-    resp = post(self.url + '/v1/projects/', data, self.header,
-                verbose=verbose)
+                         'items': template_items or []}}
+    resp = self._write('POST', self.url + '/v1/projects/', data,
+                       verbose=verbose)
     return resp
 
   def get_projects(self, max_count=None, verbose=False):
@@ -106,7 +168,8 @@ class Daemo(object):
     Args:
       project_id: The id of the project to destroy.
     """
-    delete(self.url + '/v1/projects/' + str(project_id) + '/', self.header)
+    return self._write('DELETE',
+                       self.url + '/v1/projects/' + str(project_id) + '/', None)
 
   def publish_project(self, project_id, verbose=False):
     """Publishes a project.
@@ -115,8 +178,9 @@ class Daemo(object):
       project_id: The id of the project to publish.
       verbose: Boolean that prints out helpful comments.
     """
-    post(self.url + '/v1/projects/' + str(project_id) + '/publish/',
-         None, self.header, verbose=verbose)
+    return self._write(
+        'POST', self.url + '/v1/projects/' + str(project_id) + '/publish/',
+        None, verbose=verbose)
 
   def get_tasks(self, project_id, max_count=None, verbose=False):
     """Gets all the tasks for a project.
@@ -148,6 +212,34 @@ class Daemo(object):
                self.header, verbose=verbose)
     return resp
 
+  def get_all_tasks(self, project_id, verbose=False):
+    """Gets all the tasks of a project, following every page of results.
+
+    Args:
+      project_id: The id of the project who's tasks we want to get.
+      verbose: Boolean that prints out helpful comments.
+
+    Returns:
+      A list of tasks.
+    """
+    results = get_from_pages(
+        self.url + '/v1/tasks/?project_id=' + str(project_id),
+        self.header, verbose=verbose)
+    return results
+
+  def iter_tasks(self, project_id, verbose=False):
+    """Lazily gets the tasks of a project, one page at a time.
+
+    Args:
+      project_id: The id of the project who's tasks we want to get.
+      verbose: Boolean that prints out helpful comments.
+
+    Returns:
+      A generator of tasks.
+    """
+    return iter_pages(self.url + '/v1/tasks/?project_id=' + str(project_id),
+                      self.header, verbose=verbose)
+
   def get_task(self, task_id, verbose=False):
     """Get a specific task.
 
@@ -162,24 +254,88 @@ class Daemo(object):
                verbose=verbose)
     return resp
 
-  def create_task(self, project_id, data, price=None, verbose=False):
+  def get_validator(self, project_id, verbose=False):
+    """Gets the validator of the task data of a project.
+
+    The template items of the project are only fetched the first time.
+
+    Args:
+      project_id: The id of the project.
+      verbose: Boolean that prints out helpful comments.
+
+    Returns:
+      A TemplateValidator.
+    """
+    if project_id not in self._validators:
+      from .validation import TemplateValidator
+      project = self.get_project(project_id, verbose=verbose)
+      items = self.get_template_items(get_template_id(project),
+                                      verbose=verbose)
+      self._validators[project_id] = TemplateValidator(items)
+    return self._validators[project_id]
+
+  def create_task(self, project_id, data, price=None, validate=False,
+                  verbose=False):
     """Creates a new task for a project.
 
     Args:
       project_id: The id of the project for which we want to create a task.
       data: The data associated with this task.
       price: optional price of the task. Projects already have a default price.
+      validate: Boolean that checks `data` against the placeholders of the
+        project's template before sending it.
       verbose: Boolean that prints out helpful comments.
 
+    Raises:
+      ValueError if `validate` is True and `data` is missing a placeholder.
+
     Returns:
       The task_id of the newly created task.
     """
+    if validate:
+      self.get_validator(project_id, verbose=verbose).validate(data)
     data = {'data': data}
     if price is not None:
       data['price'] = price
-    resp = post(self.url + '/v1/tasks/?project_id=' + str(project_id),
-                data, self.header, verbose=verbose)
-    return resp['id']
+    resp = self._write('POST',
+                       self.url + '/v1/tasks/?project_id=' + str(project_id),
+                       data, verbose=verbose, transform=lambda r: r['id'])
+    return resp
+
+  def create_tasks(self, project_id, rows, price=None, max_workers=8,
+                   max_bytes=None, validate=False, verbose=False):
+    """Creates many tasks for a project concurrently.
+
+    Rows are consumed lazily, so `rows` can be a generator over a large file.
+
+    Args:
+      project_id: The id of the project for which we want to create tasks.
+      rows: An iterable of the data associated with each task.
+      price: optional price of the tasks. Projects already have a default
+        price.
+      max_workers: Maximum number of tasks created at the same time.
+      max_bytes: Optional maximum total size in bytes of the data of the
+        tasks being created at the same time.
+      validate: Boolean that checks every row against the placeholders of
+        the project's template. Rows that fail are never sent and their
+        future raises a ValueError.
+      verbose: Boolean that prints out helpful comments.
+
+    Returns:
+      A generator of (data, future) pairs in the order the tasks are created,
+      where each future resolves to the task_id.
+    """
+    validator = None
+    if validate:
+      validator = self.get_validator(project_id, verbose=verbose)
+
+    def create(data):
+      if validator is not None:
+        validator.validate(data)
+      return resolve(self.create_task(project_id, data, price=price,
+                                      verbose=verbose))
+    return bounded_map(create, rows, max_workers=max_workers,
+                       max_bytes=max_bytes)
 
   def destroy_task(self, task_id):
     """Delete a task.
@@ -187,7 +343,8 @@ class Daemo(object):
     Args:
       task_id: The id of the task to delete.
     """
-    delete(self.url + '/v1/tasks/' + str(task_id) + '/',  self.header)
+    return self._write('DELETE', self.url + '/v1/tasks/' + str(task_id) + '/',
+                       None)
 
   def get_task_results(self, task_id, verbose=False):
     """Get the results for all the assignments for a task.
@@ -204,6 +361,38 @@ class Daemo(object):
         self.header, verbose=verbose)
     return results
 
+  def download_task_artifacts(self, task_id, directory, project_id=None,
+                              max_workers=8, verbose=False):
+    """Downloads the files uploaded to the `file_upload` items of a task.
+
+    Files already in the store at `directory` are skipped and partial
+    downloads are resumed. The access token is only sent to files hosted on
+    Daemo itself.
+
+    Args:
+      task_id: The id of the task who's files we want.
+      directory: The directory of the content-addressed store.
+      project_id: Optional id of the task's project, looked up if None.
+      max_workers: Maximum number of files downloaded at the same time.
+      verbose: Boolean that prints out helpful comments.
+
+    Returns:
+      An object mapping each URL to an object containing 'sha256', 'size' and
+      'path', or to the exception raised while downloading it.
+    """
+    from .download import download_artifacts
+    from .download import find_file_urls
+    if project_id is None:
+      project_id = self.get_task(task_id, verbose=verbose)['project']
+      if isinstance(project_id, dict):
+        project_id = project_id['id']
+    project = self.get_project(project_id, verbose=verbose)
+    items = self.get_template_items(get_template_id(project), verbose=verbose)
+    results = self.get_task_results(task_id, verbose=verbose)
+    urls = find_file_urls(results, template_items=items, base_url=self.url)
+    return download_artifacts(urls, directory, self.header, auth_url=self.url,
+                              max_workers=max_workers, verbose=verbose)
+
   def get_assignments(self, task_id, verbose=False):
     """Get all the assignments associated with a task.
 
@@ -240,8 +429,10 @@ class Daemo(object):
       assignment_id: The id of the assignment we want to approve.
       verbose: Boolean that prints out helpful comments.
     """
-    resp = post(self.url + '/v1/assignments/' + str(assignment_id) + '/approve',
-                None, self.header, verbose=verbose)
+    resp = self._write(
+        'POST',
+        self.url + '/v1/assignments/' + str(assignment_id) + '/approve',
+        None, verbose=verbose)
     return resp
 
   def return_assignment(self, assignment_id, verbose=False):
@@ -251,8 +442,10 @@ class Daemo(object):
       assignment_id: The id of the assignment we want to return.
       verbose: Boolean that prints out helpful comments.
     """
-    resp = post(self.url + '/v1/assignments/' + str(assignment_id) + '/return/',
-                None, self.header, verbose=verbose)
+    resp = self._write(
+        'POST',
+        self.url + '/v1/assignments/' + str(assignment_id) + '/return/',
+        None, verbose=verbose)
     return resp
 
   def reject_assignment(self, assignment_id, verbose=False):
@@ -262,8 +455,10 @@ class Daemo(object):
       assignment_id: The id of the assignment we want to reject.
       verbose: Boolean that prints out helpful comments.
     """
-    resp = post(self.url + '/v1/assignments/' + str(assignment_id) + '/reject/',
-                None, self.header, verbose=verbose)
+    resp = self._write(
+        'POST',
+        self.url + '/v1/assignments/' + str(assignment_id) + '/reject/',
+        None, verbose=verbose)
     return resp
 
   def get_templates(self, verbose=False):
@@ -302,8 +497,9 @@ class Daemo(object):
       The template id.
     """
     data = {'name': name, 'items': items}
-    resp = post(self.url + '/v1/templates/', data, self.header, verbose=verbose)
-    return resp['id']
+    resp = self._write('POST', self.url + '/v1/templates/', data,
+                       verbose=verbose, transform=lambda r: r['id'])
+    return resp
 
   def get_template_items(self, template_id, verbose=False):
     """Get all the template_items in a template.
@@ -389,9 +585,9 @@ class Daemo(object):
       data['aux_attributes']['layout'] = layout
       data['aux_attributes']['shuffle_options'] = shuffle
       data['aux_attributes']['options'] = options
-    resp = post(self.url + '/v1/template-items/', data, self.header,
-                verbose=verbose)
-    return resp['id']
+    resp = self._write('POST', self.url + '/v1/template-items/', data,
+                       verbose=verbose, transform=lambda r: r['id'])
+    return resp
 
   def destroy_template_item(self, template_item_id):
     """Delete a template item.
@@ -399,5 +595,6 @@ class Daemo(object):
     Args:
       template_item_id: The id of the template item we want to delete.
     """
-    delete(self.url + '/v1/template-items/' + str(template_item_id),
-           self.header)
+    return self._write(
+        'DELETE', self.url + '/v1/template-items/' + str(template_item_id),
+        None)
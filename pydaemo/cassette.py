@@ -0,0 +1,238 @@
+"""Records and replays the HTTP traffic of pydaemo.
+
+Recording sends the requests to Daemo as usual and appends every request and
+response pair, with its timing, to a gzipped JSONL cassette. Replaying
+serves the responses back from the cassette without any network access,
+either at their recorded latency or as fast as possible. This makes it
+possible to profile a real upload or harvest locally:
+
+  with record('harvest.cassette'):
+    daemo.get_task_results(task_id)
+
+  with replay('harvest.cassette', realtime=False):
+    daemo.get_task_results(task_id)
+
+Requests are matched on their method, URL and body, and identical requests
+are served in the order they were recorded. Access and refresh tokens are
+redacted from the recorded responses, so a cassette never holds credentials.
+"""
+
+
+import base64
+from collections import deque
+from contextlib import contextmanager
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from .utils import set_transport
+
+
+RECORDED_HEADERS = ('Content-Length', 'Content-Range', 'Content-Type', 'ETag',
+                    'Last-Modified')
+REDACTED_FIELDS = ('access_token', 'refresh_token')
+
+
+def _redact(content):
+  """Replaces the tokens of a JSON response body with 'REDACTED'.
+  """
+  if b'_token' not in content:
+    return content
+  try:
+    body = json.loads(content.decode('utf-8'))
+  except ValueError:
+    return content
+  if not isinstance(body, dict) or not any(
+      field in body for field in REDACTED_FIELDS):
+    return content
+  body.update((field, 'REDACTED') for field in REDACTED_FIELDS
+              if field in body)
+  return json.dumps(body).encode('utf-8')
+
+
+def _body_key(method, url, kwargs):
+  """Returns the key matching a request to its recorded response.
+  """
+  body = kwargs.get('data')
+  if body is None and kwargs.get('json') is not None:
+    body = json.dumps(kwargs['json'], sort_keys=True).encode('utf-8')
+  if body is None:
+    body = b''
+  headers = kwargs.get('headers') or {}
+  if headers.get('Content-Encoding') == 'gzip':
+    # gzip embeds a timestamp, so we match on the uncompressed body.
+    body = gzip.decompress(body)
+  return '{} {} {}'.format(method, url, hashlib.sha1(body).hexdigest())
+
+
+class CassetteResponse(object):
+  """A recorded response, with the parts of `requests.Response` we use.
+  """
+
+  def __init__(self, method, url, status_code, headers, content):
+    """Constructor for CassetteResponse.
+
+    Args:
+      method: The HTTP method of the request.
+      url: The URL of the request.
+      status_code: The HTTP status code.
+      headers: An object containing the recorded headers.
+      content: The body of the response as bytes.
+    """
+    self.method = method
+    self.url = url
+    self.status_code = status_code
+    self.headers = headers
+    self.content = content
+
+  @property
+  def ok(self):
+    return self.status_code < 400
+
+  @property
+  def text(self):
+    return self.content.decode('utf-8')
+
+  def json(self):
+    return json.loads(self.content)
+
+  def raise_for_status(self):
+    """Raises an HTTPError if the recorded status is an error.
+    """
+    if not self.ok:
+      from requests.exceptions import HTTPError
+      raise HTTPError('{} Error for {} {}'.format(
+          self.status_code, self.method, self.url), response=self)
+
+  def iter_content(self, chunk_size=1):
+    for start in range(0, len(self.content), chunk_size):
+      yield self.content[start:start + chunk_size]
+
+  def close(self):
+    pass
+
+
+class RecordingTransport(object):
+  """Sends requests with `requests` and records them into a cassette.
+
+  Streamed responses are read in full so that they can be recorded.
+  """
+
+  def __init__(self, location):
+    """Constructor for RecordingTransport.
+
+    Args:
+      location: Path to the cassette. Records are appended to it.
+    """
+    self.location = location
+    self._lock = threading.Lock()
+    self._file = gzip.open(location, 'at')
+    self._start = time.time()
+
+  def request(self, method, url, **kwargs):
+    """Sends a request and records its response.
+    """
+    import requests
+    key = _body_key(method, url, kwargs)
+    start = time.time()
+    resp = requests.request(method, url, **kwargs)
+    content = _redact(resp.content)
+    elapsed = time.time() - start
+    headers = {name: resp.headers[name] for name in RECORDED_HEADERS
+               if name in resp.headers}
+    record = {'key': key, 'method': method, 'url': url,
+              'status': resp.status_code, 'headers': headers,
+              'start': start - self._start, 'elapsed': elapsed,
+              'content': base64.b64encode(content).decode('ascii')}
+    with self._lock:
+      self._file.write(json.dumps(record) + '\n')
+    return resp
+
+  def close(self):
+    """Closes the cassette.
+    """
+    with self._lock:
+      self._file.close()
+
+
+class ReplayTransport(object):
+  """Serves the responses of a cassette without sending any request.
+  """
+
+  def __init__(self, location, realtime=False):
+    """Constructor for ReplayTransport.
+
+    Args:
+      location: Path to the cassette.
+      realtime: Boolean that waits for the recorded latency of each response
+        if True, or serves them as fast as possible if False.
+    """
+    self.location = location
+    self.realtime = realtime
+    self._lock = threading.Lock()
+    self._records = {}
+    with gzip.open(location, 'rt') as f:
+      for line in f:
+        record = json.loads(line)
+        self._records.setdefault(record['key'], deque()).append(record)
+
+  def request(self, method, url, **kwargs):
+    """Returns the next recorded response of a request.
+
+    Raises:
+      LookupError if the cassette has no (more) responses for the request.
+    """
+    key = _body_key(method, url, kwargs)
+    with self._lock:
+      records = self._records.get(key)
+      if not records:
+        raise LookupError('No recorded response for {} {}.'.format(
+            method, url))
+      record = records.popleft()
+    if self.realtime:
+      time.sleep(record['elapsed'])
+    return CassetteResponse(method, url, record['status'], record['headers'],
+                            base64.b64decode(record['content']))
+
+  def remaining(self):
+    """Returns the number of recorded responses that were not served.
+    """
+    with self._lock:
+      return sum(len(records) for records in self._records.values())
+
+  def close(self):
+    pass
+
+
+@contextmanager
+def record(location):
+  """Records all the requests made inside the block into a cassette.
+
+  Args:
+    location: Path to the cassette.
+  """
+  transport = RecordingTransport(location)
+  previous = set_transport(transport)
+  try:
+    yield transport
+  finally:
+    set_transport(previous)
+    transport.close()
+
+
+@contextmanager
+def replay(location, realtime=False):
+  """Serves all the requests made inside the block from a cassette.
+
+  Args:
+    location: Path to the cassette.
+    realtime: Boolean that reproduces the recorded latency if True.
+  """
+  transport = ReplayTransport(location, realtime=realtime)
+  previous = set_transport(transport)
+  try:
+    yield transport
+  finally:
+    set_transport(previous)
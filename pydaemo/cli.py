@@ -0,0 +1,292 @@
+"""Command line interface for bulk operations on Daemo.
+
+  pydaemo upload PROJECT_ID tasks.jsonl --concurrency 16
+  pydaemo harvest PROJECT_ID --output results.jsonl
+  pydaemo review decisions.csv
+  pydaemo stats PROJECT_ID
+
+Inputs are read and outputs are written one row at a time, so memory stays
+constant regardless of the number of rows.
+"""
+
+
+import argparse
+from contextlib import ExitStack
+import csv
+import json
+import sys
+import time
+
+from .api import Daemo
+from .utils import bounded_map
+from .utils import metrics
+from .utils import resolve
+
+
+class Progress(object):
+  """A live progress and throughput display on stderr.
+  """
+
+  def __init__(self, label, stream=sys.stderr, interval=0.2):
+    """Constructor for Progress.
+
+    Args:
+      label: The name of the operation being tracked.
+      stream: Where the display is written.
+      interval: Minimum number of seconds between two refreshes.
+    """
+    self.label = label
+    self.stream = stream
+    self.interval = interval
+    self.done = 0
+    self.failed = 0
+    self.start = time.time()
+    self.last = 0
+
+  def update(self, failed=False):
+    """Records one more processed row.
+
+    Args:
+      failed: Boolean set to True if the row failed.
+    """
+    if failed:
+      self.failed += 1
+    else:
+      self.done += 1
+    now = time.time()
+    if now - self.last >= self.interval:
+      self.last = now
+      self._display(now)
+
+  def _display(self, now, end=''):
+    elapsed = max(now - self.start, 1e-9)
+    self.stream.write('\r{}: {} done, {} failed, {:.1f} rows/s{}'.format(
+        self.label, self.done, self.failed,
+        (self.done + self.failed) / elapsed, end))
+    self.stream.flush()
+
+  def close(self):
+    """Displays the final counts.
+    """
+    self._display(time.time(), end='\n')
+
+
+def read_rows(location, file_format=None):
+  """Lazily reads rows from a JSONL or CSV file.
+
+  Args:
+    location: Path to the file, or '-' for stdin.
+    file_format: One of `jsonl or csv`. Guessed from the extension if None.
+
+  Returns:
+    A generator of objects, one per row.
+  """
+  if file_format is None:
+    file_format = 'csv' if location.endswith('.csv') else 'jsonl'
+  f = sys.stdin if location == '-' else open(location, 'r', newline='')
+  try:
+    if file_format == 'csv':
+      for row in csv.DictReader(f):
+        yield row
+    else:
+      for line in f:
+        if line.strip():
+          yield json.loads(line)
+  finally:
+    if f is not sys.stdin:
+      f.close()
+
+
+def open_output(location):
+  """Opens the output file, or stdout if location is None or '-'.
+  """
+  if location is None or location == '-':
+    return sys.stdout
+  return open(location, 'w')
+
+
+def upload(daemo, args):
+  """Creates a task for every row of the input.
+  """
+  progress = Progress('upload')
+  output = open_output(args.output)
+  rows = read_rows(args.input, args.format)
+  for data, future in daemo.create_tasks(args.project_id, rows,
+                                         max_workers=args.concurrency,
+                                         max_bytes=args.max_bytes,
+                                         validate=args.validate):
+    try:
+      task_id = future.result()
+    except Exception as e:
+      progress.update(failed=True)
+      sys.stderr.write('\nfailed to create task {}: {}\n'.format(
+          json.dumps(data), e))
+      continue
+    output.write(json.dumps({'task_id': task_id, 'data': data}) + '\n')
+    progress.update()
+  progress.close()
+  if output is not sys.stdout:
+    output.close()
+
+
+def harvest(daemo, args):
+  """Writes the results of every task of a project.
+  """
+  progress = Progress('harvest')
+  output = open_output(args.output)
+  tasks = (task['id'] for task in daemo.iter_tasks(args.project_id))
+  for task_id, future in bounded_map(daemo.get_task_results, tasks,
+                                     max_workers=args.concurrency):
+    try:
+      results = future.result()
+    except Exception as e:
+      progress.update(failed=True)
+      sys.stderr.write('\nfailed to harvest task {}: {}\n'.format(task_id, e))
+      continue
+    for result in results:
+      output.write(json.dumps({'task_id': task_id, 'result': result}) + '\n')
+    progress.update()
+  progress.close()
+  if output is not sys.stdout:
+    output.close()
+
+
+def review(daemo, args):
+  """Applies the approve, reject or return decisions of the input.
+  """
+  actions = {'approve': daemo.approve_assignment,
+             'reject': daemo.reject_assignment,
+             'return': daemo.return_assignment}
+
+  def decide(row):
+    return resolve(actions[row['decision']](row['assignment_id']))
+
+  progress = Progress('review')
+  rows = read_rows(args.input, args.format)
+  for row, future in bounded_map(decide, rows, max_workers=args.concurrency):
+    try:
+      future.result()
+    except Exception as e:
+      progress.update(failed=True)
+      sys.stderr.write('\nfailed to {} assignment {}: {}\n'.format(
+          row.get('decision'), row.get('assignment_id'), e))
+      continue
+    progress.update()
+  progress.close()
+
+
+def stats(daemo, args):
+  """Prints throughput metrics of a project.
+  """
+  from .analytics import Throughput
+  from .analytics import summarize
+  progress = Progress('stats')
+  tasks = daemo.get_all_tasks(args.project_id)
+  assignments = []
+  for _, future in bounded_map(daemo.get_assignments,
+                               (task['id'] for task in tasks),
+                               max_workers=args.concurrency):
+    assignments.extend(future.result())
+    progress.update()
+  progress.close()
+  throughput = Throughput(assignments, tasks=tasks)
+  submitted = sum(1 for a in assignments if a.get('submitted_at'))
+  repetition = daemo.get_project(args.project_id).get('repetition', 1)
+  summary = {
+      'tasks': len(tasks),
+      'assignments': len(assignments),
+      'time_to_accept': summarize(throughput.time_to_accept()),
+      'time_to_submit': summarize(throughput.time_to_submit()),
+      'turnaround': summarize(throughput.turnaround()[1]),
+      'forecast': throughput.forecast(
+          max(len(tasks) * repetition - submitted, 0)),
+  }
+  print(json.dumps(summary, indent=2))
+
+
+def main(argv=None):
+  """Entry point of the `pydaemo` command.
+
+  Args:
+    argv: The command line arguments. Defaults to sys.argv.
+  """
+  # The flags shared by all the commands, given after the command name.
+  common = argparse.ArgumentParser(add_help=False)
+  common.add_argument('--credentials', default='credentials.json',
+                      help='location of the credentials file')
+  common.add_argument('--prod', action='store_true',
+                      help='use production instead of the sandbox')
+  common.add_argument('--update-credentials', action='store_true',
+                      help='refresh the access token before starting')
+  common.add_argument('--concurrency', type=int, default=8,
+                      help='number of requests in flight')
+  common.add_argument('--compress', action='store_true',
+                      help='gzip the body of the requests')
+  common.add_argument('--record', metavar='CASSETTE',
+                      help='record the HTTP traffic into a cassette')
+  common.add_argument('--replay', metavar='CASSETTE',
+                      help='serve the HTTP traffic from a cassette')
+  common.add_argument('--realtime', action='store_true',
+                      help='replay responses at their recorded latency')
+  parser = argparse.ArgumentParser(
+      prog='pydaemo', description='Bulk operations on Daemo.')
+  subparsers = parser.add_subparsers(dest='command')
+  subparsers.required = True
+
+  parser_upload = subparsers.add_parser(
+      'upload', parents=[common],
+      help='create a task for every row of a JSONL or CSV file')
+  parser_upload.add_argument('project_id')
+  parser_upload.add_argument('input', help='input file, or - for stdin')
+  parser_upload.add_argument('--format', choices=['jsonl', 'csv'])
+  parser_upload.add_argument('--output', help='where created task ids go')
+  parser_upload.add_argument('--no-validate', dest='validate',
+                             action='store_false',
+                             help='skip the template placeholder checks')
+  parser_upload.add_argument('--max-bytes', type=int,
+                             help='maximum size of the task data in flight')
+  parser_upload.set_defaults(run=upload)
+
+  parser_harvest = subparsers.add_parser(
+      'harvest', parents=[common],
+      help='write the results of a project as JSONL')
+  parser_harvest.add_argument('project_id')
+  parser_harvest.add_argument('--output', help='output file, default stdout')
+  parser_harvest.set_defaults(run=harvest)
+
+  parser_review = subparsers.add_parser(
+      'review', parents=[common],
+      help='apply decisions with `assignment_id` and `decision` '
+      '(approve, reject or return) columns')
+  parser_review.add_argument('input', help='input file, or - for stdin')
+  parser_review.add_argument('--format', choices=['jsonl', 'csv'])
+  parser_review.set_defaults(run=review)
+
+  parser_stats = subparsers.add_parser(
+      'stats', parents=[common],
+      help='print throughput metrics of a project')
+  parser_stats.add_argument('project_id')
+  parser_stats.set_defaults(run=stats)
+
+  args = parser.parse_args(argv)
+  if args.record is not None and args.replay is not None:
+    parser.error('--record and --replay cannot be used together')
+  if args.replay is not None and args.update_credentials:
+    # The cassette only holds redacted tokens.
+    parser.error('--update-credentials cannot be used with --replay')
+  with ExitStack() as stack:
+    if args.record is not None:
+      from .cassette import record
+      stack.enter_context(record(args.record))
+    if args.replay is not None:
+      from .cassette import replay
+      stack.enter_context(replay(args.replay, realtime=args.realtime))
+    daemo = Daemo(credential_file=args.credentials, prod=args.prod,
+                  update_credentials=args.update_credentials,
+                  compress=args.compress)
+    args.run(daemo, args)
+  sys.stderr.write('{}\n'.format(json.dumps(metrics.snapshot())))
+
+
+if __name__ == '__main__':
+  main()
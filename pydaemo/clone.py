@@ -0,0 +1,147 @@
+"""Clones a project from one Daemo environment to another.
+
+This is mostly useful to build a project on `https://sandbox.daemo.org` and
+then recreate it on production:
+
+  sandbox = Daemo(prod=False)
+  daemo = Daemo(prod=True)
+  mapping = clone_project(sandbox, daemo, project_id, state_file='clone.json')
+"""
+
+
+import json
+import os
+
+from .utils import bounded_map
+from .utils import get_template_id
+from .utils import json_size
+from .utils import resolve
+
+
+def _copy_item(item):
+  """Strips the environment specific fields of a template item resource.
+  """
+  return {key: value for key, value in item.items()
+          if key not in ('id', 'template', 'predecessor')}
+
+
+def _load_state(state_file, project_id):
+  """Loads the id mapping of a previous, interrupted clone.
+
+  The state file is a JSONL log: its first line maps the project, template
+  and template items and every following line maps one task.
+
+  Raises:
+    ValueError if the state file belongs to the clone of another project.
+  """
+  state = {'project_id': str(project_id), 'project': None, 'template': None,
+           'template_items': {}, 'tasks': {}}
+  if state_file is None or not os.path.exists(state_file):
+    return state
+  with open(state_file, 'r') as f:
+    for line in f:
+      try:
+        entry = json.loads(line)
+      except ValueError:
+        # A partially written last line: that task was never recorded.
+        break
+      if 'task' in entry:
+        state['tasks'][entry['task']] = entry['new']
+      else:
+        state.update(entry)
+  if state['project_id'] != str(project_id):
+    raise ValueError('{} is the state of the clone of project {}, not {}.'
+                     .format(state_file, state['project_id'], project_id))
+  return state
+
+
+def _append_state(state_file, entry):
+  """Durably appends an entry to the state file.
+  """
+  if state_file is None:
+    return
+  with open(state_file, 'a') as f:
+    f.write(json.dumps(entry) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def clone_project(src_client, dst_client, project_id, state_file=None,
+                  max_workers=8, max_bytes=None, verbose=False):
+  """Recreates a project, its template, template items and tasks.
+
+  The project is created along with all of its template items in a single
+  request, in the order the source returns them, and the tasks are then
+  created concurrently. When `state_file` is
+  set, every created task is recorded in it as soon as it is created, and an
+  interrupted clone resumes where it stopped. Only the tasks that were in
+  flight when the clone was interrupted can be created twice.
+
+  Args:
+    src_client: The Daemo client to read the project from.
+    dst_client: The Daemo client to create the project with.
+    project_id: The id of the project to clone.
+    state_file: Optional path to the file used to resume the clone.
+    max_workers: Maximum number of tasks created at the same time.
+    max_bytes: Optional maximum total size in bytes of the data of the
+      tasks being created at the same time.
+    verbose: Boolean that prints out helpful comments.
+
+  Raises:
+    ValueError if `state_file` belongs to the clone of another project, or
+    if the new project does not have as many template items as the source.
+
+  Returns:
+    An object mapping the source ids to the new ids under 'project',
+    'template', 'template_items' and 'tasks', along with 'errors' which maps
+    the ids of the tasks that could not be created to their error.
+  """
+  state = _load_state(state_file, project_id)
+  project = src_client.get_project(project_id, verbose=verbose)
+  template_id = get_template_id(project)
+  if state['project'] is None:
+    template = src_client.get_template(template_id, verbose=verbose)
+    items = src_client.get_template_items(template_id, verbose=verbose)
+    new_project = resolve(dst_client.create_project(
+        project['name'], project['price'], template['name'],
+        repetition=project.get('repetition', 1),
+        timeout=project.get('timeout', 120),
+        template_items=[_copy_item(item) for item in items],
+        verbose=verbose))
+    new_template_id = get_template_id(new_project)
+    new_items = dst_client.get_template_items(new_template_id,
+                                              verbose=verbose)
+    if len(new_items) != len(items):
+      raise ValueError('Project {} was created with {} template items instead '
+                       'of {}.'.format(new_project['id'], len(new_items),
+                                       len(items)))
+    state['project'] = new_project['id']
+    state['template'] = new_template_id
+    state['template_items'] = {str(old['id']): new['id']
+                               for old, new in zip(items, new_items)}
+    _append_state(state_file, {key: state[key] for key in (
+        'project_id', 'project', 'template', 'template_items')})
+
+  def create(task):
+    return resolve(dst_client.create_task(
+        state['project'], task['data'], price=task.get('price'),
+        verbose=verbose))
+
+  tasks = [task for task in src_client.get_all_tasks(project_id, verbose)
+           if str(task['id']) not in state['tasks']]
+  errors = {}
+  for task, future in bounded_map(
+      create, tasks, max_workers=max_workers, max_bytes=max_bytes,
+      size=lambda task: json_size(task['data'])):
+    try:
+      new_task_id = future.result()
+    except Exception as e:
+      if verbose:
+        print('failed to clone task', task['id'], e)
+      errors[str(task['id'])] = e
+      continue
+    state['tasks'][str(task['id'])] = new_task_id
+    _append_state(state_file, {'task': str(task['id']), 'new': new_task_id})
+  del state['project_id']
+  return dict(state, project={str(project_id): state['project']},
+              template={str(template_id): state['template']}, errors=errors)
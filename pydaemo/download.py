@@ -0,0 +1,356 @@
+"""Downloads the files that workers upload through `file_upload` items.
+
+Files are streamed to disk in chunks and kept in a content-addressed store:
+every file is saved under the sha256 of its contents and an index maps the
+URL it was downloaded from to that digest. Interrupted downloads leave a
+partial file behind that is resumed on the next run.
+"""
+
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import urljoin
+from urllib.parse import urlsplit
+
+from .utils import metrics
+from .utils import request
+
+
+CHUNK_SIZE = 1 << 16
+
+
+def _strings(value):
+  """Yields all the strings nested in a value, in order.
+  """
+  if isinstance(value, dict):
+    for item in value.values():
+      yield from _strings(item)
+  elif isinstance(value, (list, tuple)):
+    for item in value:
+      yield from _strings(item)
+  elif isinstance(value, str):
+    yield value
+
+
+def _is_file_upload(result, file_item_ids):
+  """Returns True if a result answers a `file_upload` template item.
+  """
+  item = result.get('template_item')
+  if isinstance(item, dict):
+    return item.get('type') == 'file_upload' or item.get('id') in file_item_ids
+  return item in file_item_ids
+
+
+def find_file_urls(results, template_items=(), base_url=None):
+  """Finds the file URLs uploaded through `file_upload` template items.
+
+  Only the values of results answering a `file_upload` item are considered,
+  so links that workers typed in other fields are never downloaded.
+
+  Args:
+    results: A list of assignment results, as returned by
+      `Daemo.get_task_results`.
+    template_items: The template item resources of the project, used to know
+      which items are `file_upload` items.
+    base_url: Optional URL that relative file paths are resolved against.
+
+  Returns:
+    A list of unique URLs, in the order they were first seen.
+  """
+  file_item_ids = set(item['id'] for item in template_items
+                      if item.get('type') == 'file_upload')
+  urls = []
+  seen = set()
+  stack = [results]
+  while stack:
+    value = stack.pop()
+    if isinstance(value, (list, tuple)):
+      stack.extend(reversed(value))
+    elif not isinstance(value, dict):
+      continue
+    elif 'template_item' not in value:
+      stack.extend(reversed(list(value.values())))
+    elif _is_file_upload(value, file_item_ids):
+      for url in _strings(value.get('result')):
+        if base_url is not None and url.startswith('/'):
+          url = urljoin(base_url, url)
+        if url.startswith(('http://', 'https://')) and url not in seen:
+          seen.add(url)
+          urls.append(url)
+  return urls
+
+
+def _same_host(url, other):
+  """Returns True if two URLs point to the same scheme, host and port.
+  """
+  url, other = urlsplit(url), urlsplit(other)
+  return (url.scheme, url.netloc) == (other.scheme, other.netloc)
+
+
+class ArtifactStore(object):
+  """A content-addressed store of downloaded files.
+  """
+
+  def __init__(self, directory):
+    """Constructor for ArtifactStore.
+
+    Args:
+      directory: The directory in which the files are stored. It is created
+        if it does not exist.
+    """
+    self.directory = directory
+    self.objects = os.path.join(directory, 'objects')
+    self.partial = os.path.join(directory, 'partial')
+    self.index_file = os.path.join(directory, 'index.json')
+    os.makedirs(self.objects, exist_ok=True)
+    os.makedirs(self.partial, exist_ok=True)
+    self._lock = threading.Lock()
+    self.index = {}
+    if os.path.exists(self.index_file):
+      with open(self.index_file, 'r') as f:
+        self.index = json.load(f)
+
+  def path(self, digest):
+    """Returns the location of a stored file.
+
+    Args:
+      digest: The sha256 hex digest of the file.
+    """
+    return os.path.join(self.objects, digest[:2], digest)
+
+  def partial_path(self, url):
+    """Returns the location of the partial download of a URL.
+
+    Args:
+      url: The URL being downloaded.
+    """
+    name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(self.partial, name + '.part')
+
+  def load_validator(self, url):
+    """Returns the validator of the partial download of a URL.
+
+    Args:
+      url: The URL being downloaded.
+
+    Returns:
+      An object containing the 'ETag' and/or 'Last-Modified' of the file
+      when the partial download was started, or None.
+    """
+    path = self.partial_path(url) + '.json'
+    if not os.path.exists(path):
+      return None
+    try:
+      with open(path, 'r') as f:
+        return json.load(f)
+    except ValueError:
+      return None
+
+  def save_validator(self, url, headers):
+    """Saves the validator of a partial download from its response headers.
+
+    Args:
+      url: The URL being downloaded.
+      headers: The headers of the response that started the download.
+    """
+    validator = {name: headers[name] for name in ('ETag', 'Last-Modified')
+                 if headers.get(name) is not None}
+    with open(self.partial_path(url) + '.json', 'w') as f:
+      json.dump(validator, f)
+
+  def discard_validator(self, url):
+    """Removes the validator of the partial download of a URL.
+
+    Args:
+      url: The URL being downloaded.
+    """
+    path = self.partial_path(url) + '.json'
+    if os.path.exists(path):
+      os.remove(path)
+
+  def lookup(self, url):
+    """Returns the index entry for a URL if its file is already stored.
+
+    Args:
+      url: The URL we want to look up.
+
+    Returns:
+      An object containing 'sha256', 'size' and 'path' or None.
+    """
+    with self._lock:
+      entry = self.index.get(url)
+    if entry is None:
+      return None
+    path = self.path(entry['sha256'])
+    if not os.path.exists(path) or os.path.getsize(path) != entry['size']:
+      return None
+    return dict(entry, path=path)
+
+  def add(self, url, partial_path, digest, size):
+    """Moves a completed download into the store and indexes it.
+
+    Args:
+      url: The URL the file was downloaded from.
+      partial_path: The location of the completed download.
+      digest: The sha256 hex digest of the file.
+      size: The size of the file in bytes.
+
+    Returns:
+      An object containing 'sha256', 'size' and 'path'.
+    """
+    path = self.path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+      os.remove(partial_path)
+    else:
+      os.replace(partial_path, path)
+    self.discard_validator(url)
+    with self._lock:
+      self.index[url] = {'sha256': digest, 'size': size}
+    return {'sha256': digest, 'size': size, 'path': path}
+
+  def save(self):
+    """Writes the index to disk.
+    """
+    with self._lock:
+      tmp = self.index_file + '.tmp'
+      with open(tmp, 'w') as f:
+        json.dump(self.index, f)
+      os.replace(tmp, self.index_file)
+
+
+def download_file(url, store, header=None, sha256=None, verbose=False):
+  """Downloads a single file into the store.
+
+  The file is streamed to disk in chunks of `CHUNK_SIZE` bytes. If a partial
+  download exists, only the remaining bytes are requested, on the condition
+  (`If-Range`) that the file still has the `ETag` or `Last-Modified` it had
+  when the download started. Otherwise the server sends the whole file and
+  the download starts over.
+
+  Args:
+    url: The URL of the file.
+    store: The ArtifactStore to download into.
+    header: header to be sent along with the request.
+    sha256: Optional expected sha256 hex digest of the file.
+    verbose: Boolean that prints out helpful comments.
+
+  Raises:
+    HTTPError is the request fails.
+    IOError if the size or the checksum of the file do not match.
+
+  Returns:
+    An object containing 'sha256', 'size' and 'path'.
+  """
+  entry = store.lookup(url)
+  if entry is not None:
+    if verbose:
+      print('skipping', url)
+    return entry
+  partial_path = store.partial_path(url)
+  offset = 0
+  if os.path.exists(partial_path):
+    offset = os.path.getsize(partial_path)
+  # Ranges and sizes refer to the raw file, so we ask for it uncompressed.
+  headers = {key: value for key, value in (header or {}).items()
+             if key != 'Content-Encoding'}
+  headers['Accept-Encoding'] = 'identity'
+  if offset > 0:
+    validator = store.load_validator(url) or {}
+    etag = validator.get('ETag')
+    # Weak ETags cannot be used in If-Range.
+    if etag is not None and not etag.startswith('W/'):
+      headers['If-Range'] = etag
+    elif validator.get('Last-Modified') is not None:
+      headers['If-Range'] = validator['Last-Modified']
+    else:
+      # Without a validator we cannot tell if the file changed since.
+      offset = 0
+  if offset > 0:
+    headers['Range'] = 'bytes={}-'.format(offset)
+  if verbose:
+    print('GET', url, 'from byte', offset)
+  resp = request('GET', url, headers=headers, stream=True)
+  received = 0
+  try:
+    if resp.status_code == 416:
+      # The partial file is already complete (or larger than the file).
+      resp.close()
+      offset = 0
+      headers.pop('Range', None)
+      headers.pop('If-Range', None)
+      resp = request('GET', url, headers=headers, stream=True)
+    resp.raise_for_status()
+    if resp.status_code != 206:
+      # The whole file was sent, e.g. because it changed: start over.
+      offset = 0
+      store.save_validator(url, resp.headers)
+    expected_size = None
+    if resp.headers.get('Content-Length') is not None:
+      expected_size = offset + int(resp.headers['Content-Length'])
+    digest = hashlib.sha256()
+    if offset > 0:
+      with open(partial_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+          digest.update(chunk)
+    with open(partial_path, 'ab' if offset > 0 else 'wb') as f:
+      for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+        f.write(chunk)
+        digest.update(chunk)
+        received += len(chunk)
+  finally:
+    resp.close()
+    metrics.record(received=received)
+  size = offset + received
+  if expected_size is not None and size != expected_size:
+    raise IOError('Incomplete download of {}: got {} of {} bytes.'.format(
+        url, size, expected_size))
+  digest = digest.hexdigest()
+  if sha256 is not None and digest != sha256:
+    os.remove(partial_path)
+    store.discard_validator(url)
+    raise IOError('Checksum mismatch for {}: expected {}, got {}.'.format(
+        url, sha256, digest))
+  return store.add(url, partial_path, digest, size)
+
+
+def download_artifacts(urls, directory, header=None, auth_url=None,
+                       checksums=None, max_workers=8, verbose=False):
+  """Downloads many files concurrently into a content-addressed store.
+
+  Args:
+    urls: A list of URLs to download.
+    directory: The directory of the ArtifactStore.
+    header: header to be sent along with the requests. It carries the Daemo
+      access token, so it is only sent to URLs on the host of `auth_url`.
+    auth_url: The URL of the Daemo server the header belongs to. When None,
+      the header is never sent.
+    checksums: Optional object mapping URLs to their expected sha256 digest.
+    max_workers: Maximum number of files downloaded at the same time.
+    verbose: Boolean that prints out helpful comments.
+
+  Returns:
+    An object mapping each URL to an object containing 'sha256', 'size' and
+    'path', or to the exception raised while downloading it.
+  """
+  store = ArtifactStore(directory)
+  checksums = checksums or {}
+  downloaded = {}
+  try:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      futures = [(url, executor.submit(
+          download_file, url, store,
+          header if auth_url is not None and _same_host(url, auth_url)
+          else None,
+          checksums.get(url), verbose)) for url in urls]
+      for url, future in futures:
+        try:
+          downloaded[url] = future.result()
+        except Exception as e:
+          downloaded[url] = e
+  finally:
+    store.save()
+  return downloaded
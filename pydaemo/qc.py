@@ -0,0 +1,316 @@
+"""Automatic review of assignment results against gold-standard tasks.
+
+Projects are seeded with gold tasks whose answers are known. As results come
+in, the ones for gold tasks are approved or rejected on their own answer and
+update a running accuracy for their worker. Every other result is approved,
+rejected or returned once its worker has answered enough gold tasks:
+
+  qc = QualityControl(daemo, gold={gold_task_id: 'cat'})
+  print(qc.run(poll_results(daemo, task_ids, repetition=3,
+                            redone=qc.redone)))
+
+With `redone`, results that were rejected or returned do not count towards
+their task, so polling goes on until they are revised or replaced.
+"""
+
+
+import time
+
+from .utils import bounded_map
+from .utils import resolve
+
+
+def exact_match(answer, gold):
+  """Scores an answer 1.0 if it equals the gold answer, 0.0 otherwise.
+  """
+  return 1.0 if answer == gold else 0.0
+
+
+def poll_results(client, task_ids, repetition=1, interval=30, stop=None,
+                 timeout=24 * 60 * 60, redone=None,
+                 revision=lambda result: result.get('result'), max_workers=8,
+                 key='id', verbose=False):
+  """Yields the results of tasks as they are submitted.
+
+  Polling goes on until every task has `repetition` results that were not
+  redone, until `stop` returns True or until `timeout` has elapsed. Tasks
+  that have all of their results are no longer polled.
+
+  Args:
+    client: The Daemo client.
+    task_ids: The ids of the tasks to watch.
+    repetition: The number of results each task gets, i.e. the repetition
+      of the project.
+    interval: Number of seconds between two polls.
+    stop: Optional function returning True when polling should stop early.
+    timeout: Maximum number of seconds to poll for, or None to poll until
+      every task has all of its results.
+    redone: Optional function returning True for a result that was rejected
+      or returned, e.g. `QualityControl.redone`. Such results do not count
+      towards their task, and they are yielded again once revised.
+    revision: Function returning the part of a result that changes when its
+      worker revises it.
+    max_workers: Maximum number of tasks polled at the same time.
+    key: The result field that identifies a result.
+    verbose: Boolean that prints out helpful comments.
+
+  Returns:
+    A generator of assignment results, each yielded once per submission.
+  """
+  results = {task_id: {} for task_id in task_ids}
+  deadline = None if timeout is None else time.time() + timeout
+
+  def complete(task_id):
+    return sum(1 for result in results[task_id].values()
+               if redone is None or not redone(result)) >= repetition
+
+  while True:
+    pending = [task_id for task_id in results if not complete(task_id)]
+    for task_id, future in bounded_map(
+        lambda task_id: client.get_task_results(task_id, verbose=verbose),
+        pending, max_workers=max_workers):
+      for result in future.result():
+        previous = results[task_id].get(result[key])
+        if previous is not None and (
+            redone is None or not redone(previous) or
+            revision(result) == revision(previous)):
+          continue
+        results[task_id][result[key]] = result
+        yield result
+    if all(complete(task_id) for task_id in results):
+      return
+    if stop is not None and stop():
+      return
+    if deadline is not None and time.time() >= deadline:
+      if verbose:
+        print('stopped polling after', timeout, 'seconds')
+      return
+    time.sleep(interval)
+
+
+class QualityControl(object):
+  """Scores assignment results and approves, rejects or returns them.
+  """
+
+  def __init__(self, client, gold, approve_threshold=0.8,
+               reject_threshold=0.5, min_gold=3, prior=(1.0, 1.0),
+               score=exact_match, answer=lambda result: result['result'],
+               assignment_field='assignment', worker_field='worker',
+               task_field='task', gold_pass=1.0, undecided='return',
+               batch_size=50, max_workers=8, verbose=False):
+    """Constructor for QualityControl.
+
+    Args:
+      client: The Daemo client used to issue the decisions.
+      gold: An object mapping gold task ids to their answer.
+      approve_threshold: Workers with at least this accuracy are approved.
+      reject_threshold: Workers below this accuracy are rejected. Workers in
+        between have their assignments returned.
+      min_gold: Number of gold tasks a worker has to answer before their
+        other results are decided. Until then they are held.
+      prior: Pseudo-counts of (correct, incorrect) gold answers that every
+        worker starts with.
+      score: Function scoring an answer against a gold answer, in [0, 1].
+      answer: Function extracting the answer from a result.
+      assignment_field: The result field containing the assignment id.
+      worker_field: The result field containing the worker id.
+      task_field: The result field containing the task id.
+      gold_pass: Minimum score for a gold result to be approved. Gold
+        results scoring lower are rejected, whatever their worker's accuracy.
+      undecided: What `run` does with the results still held when the
+        stream ends: one of `approve, reject, return` or `hold` to leave
+        them held.
+      batch_size: Number of decisions issued together.
+      max_workers: Maximum number of decisions issued at the same time.
+      verbose: Boolean that prints out helpful comments.
+    """
+    if undecided not in ('approve', 'reject', 'return', 'hold'):
+      raise ValueError('\'undecided\' needs to be one of approve, reject, '
+                       'return or hold.')
+    if reject_threshold > approve_threshold:
+      raise ValueError('\'reject_threshold\' needs to be lower than '
+                       '\'approve_threshold\'.')
+    self.client = client
+    self.gold = gold
+    self.approve_threshold = approve_threshold
+    self.reject_threshold = reject_threshold
+    self.min_gold = min_gold
+    self.prior = prior
+    self.score = score
+    self.answer = answer
+    self.assignment_field = assignment_field
+    self.worker_field = worker_field
+    self.task_field = task_field
+    self.gold_pass = gold_pass
+    self.undecided = undecided
+    self.batch_size = batch_size
+    self.max_workers = max_workers
+    self.verbose = verbose
+    self.actions = {'approve': client.approve_assignment,
+                    'reject': client.reject_assignment,
+                    'return': client.return_assignment}
+    self.workers = {}
+    self.held = {}
+    self.decisions = []
+    self.redone_assignments = set()
+    self.counters = {'processed': 0, 'approve': 0, 'reject': 0, 'return': 0,
+                     'failed': 0, 'released': 0}
+    self.latency_total = 0.0
+    self.latency_max = 0.0
+    self.start = time.time()
+
+  def accuracy(self, worker):
+    """Returns the running accuracy of a worker on gold tasks.
+
+    Args:
+      worker: The id of the worker.
+    """
+    correct, answered = self.workers.get(worker, (0.0, 0))
+    return ((correct + self.prior[0]) /
+            (answered + self.prior[0] + self.prior[1]))
+
+  def decide(self, worker):
+    """Returns the decision for a worker's results or None to hold them.
+
+    Args:
+      worker: The id of the worker.
+    """
+    if self.workers.get(worker, (0.0, 0))[1] < self.min_gold:
+      return None
+    accuracy = self.accuracy(worker)
+    if accuracy >= self.approve_threshold:
+      return 'approve'
+    if accuracy < self.reject_threshold:
+      return 'reject'
+    return 'return'
+
+  def redone(self, result):
+    """Returns True if a result was rejected or returned.
+
+    Args:
+      result: An assignment result.
+    """
+    return result[self.assignment_field] in self.redone_assignments
+
+  def _queue(self, assignment, action, arrived):
+    """Queues a decision for an assignment.
+    """
+    self.decisions.append((assignment, action, arrived))
+    if action in ('reject', 'return'):
+      self.redone_assignments.add(assignment)
+
+  def process(self, result):
+    """Scores a result and queues a decision for it when possible.
+
+    Gold results are decided on their own score. Other results are decided
+    by the accuracy of their worker, or held until it is known.
+
+    Args:
+      result: An assignment result.
+    """
+    arrived = time.time()
+    self.counters['processed'] += 1
+    worker = result[self.worker_field]
+    task = result[self.task_field]
+    assignment = result[self.assignment_field]
+    # A revised result is a new submission, to be decided again.
+    self.redone_assignments.discard(assignment)
+    if task in self.gold:
+      score = self.score(self.answer(result), self.gold[task])
+      correct, answered = self.workers.get(worker, (0.0, 0))
+      self.workers[worker] = (correct + score, answered + 1)
+      self._queue(assignment,
+                  'approve' if score >= self.gold_pass else 'reject', arrived)
+    else:
+      self.held.setdefault(worker, []).append((assignment, arrived))
+    decision = self.decide(worker)
+    if decision is not None and worker in self.held:
+      for held_assignment, arrived_at in self.held.pop(worker):
+        self._queue(held_assignment, decision, arrived_at)
+    if len(self.decisions) >= self.batch_size:
+      self.flush()
+
+  def flush(self):
+    """Issues all the queued decisions.
+    """
+    decisions, self.decisions = self.decisions, []
+
+    def issue(decision):
+      assignment, action, _ = decision
+      return resolve(self.actions[action](assignment, verbose=self.verbose))
+
+    for (assignment, action, arrived), future in bounded_map(
+        issue, decisions, max_workers=self.max_workers):
+      try:
+        future.result()
+      except Exception as e:
+        if self.verbose:
+          print('failed to', action, 'assignment', assignment, e)
+        self.counters['failed'] += 1
+        # The worker was never asked for another result.
+        self.redone_assignments.discard(assignment)
+        continue
+      latency = time.time() - arrived
+      self.counters[action] += 1
+      self.latency_total += latency
+      self.latency_max = max(self.latency_max, latency)
+
+  def release(self, action):
+    """Decides all the held results with the same action.
+
+    Args:
+      action: One of `approve, reject or return`.
+
+    Returns:
+      The ids of the assignments that were released.
+    """
+    released = []
+    for held in self.held.values():
+      for assignment, arrived in held:
+        self._queue(assignment, action, arrived)
+        released.append(assignment)
+    self.held = {}
+    self.counters['released'] += len(released)
+    return released
+
+  def run(self, results):
+    """Processes a stream of results and issues the remaining decisions.
+
+    Results still held when the stream ends are handled according to
+    `undecided`.
+
+    Args:
+      results: An iterable of assignment results, e.g. `poll_results`.
+
+    Returns:
+      The `stats` of the pipeline, along with 'undecided': the ids of the
+      assignments that were released by the `undecided` policy, or that are
+      still held if it is `hold`.
+    """
+    for result in results:
+      self.process(result)
+    if self.undecided == 'hold':
+      undecided = [assignment for held in self.held.values()
+                   for assignment, _ in held]
+    else:
+      undecided = self.release(self.undecided)
+    self.flush()
+    return dict(self.stats(), undecided=undecided)
+
+  def stats(self):
+    """Returns the counters of the pipeline.
+
+    Returns:
+      An object with the number of results 'processed', 'held' and
+      'released' by the `undecided` policy, the number of decisions of each
+      kind, the 'failed' decisions, the mean and max
+      decision latency in seconds and the decision throughput per second.
+    """
+    decided = (self.counters['approve'] + self.counters['reject'] +
+               self.counters['return'])
+    elapsed = max(time.time() - self.start, 1e-9)
+    return dict(self.counters,
+                held=sum(len(held) for held in self.held.values()),
+                latency_mean=self.latency_total / decided if decided else None,
+                latency_max=self.latency_max,
+                throughput=decided / elapsed)
@@ -0,0 +1,225 @@
+"""A durable, on-disk spool for the requests that modify Daemo resources.
+
+Writes that could not connect to Daemo are appended to a log file, and a
+background thread sends them to Daemo in order. While Daemo cannot be
+connected to, the thread keeps retrying the oldest write. Writes that were
+still in the log when the process stopped are sent the next time the spool
+is opened.
+
+Only errors raised before the request was sent (failing to resolve or
+connect to the host) are retried, since such a request cannot have been
+applied. Any other error, including a connection reset while waiting for the
+response, fails the write: it may or may not have been applied, and retrying
+it could, e.g., create a task twice. Every write also carries an
+`Idempotency-Key` header that stays the same across retries and restarts,
+which servers that support it can use to deduplicate writes.
+"""
+
+
+from collections import OrderedDict
+from collections import deque
+from concurrent.futures import Future
+import json
+import os
+import threading
+import uuid
+
+from .utils import delete
+from .utils import make_request
+
+
+def is_connect_error(error):
+  """Returns True if a request failed before it could be sent.
+
+  Args:
+    error: The exception raised by the request.
+  """
+  import requests
+  from urllib3.exceptions import ConnectTimeoutError
+  from urllib3.exceptions import NewConnectionError
+  if isinstance(error, requests.exceptions.ConnectTimeout):
+    return True
+  if not isinstance(error, requests.exceptions.ConnectionError):
+    return False
+  reason = error.args[0] if error.args else None
+  reason = getattr(reason, 'reason', reason)
+  return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def then(future, fn):
+  """Chains a function to the result of a future.
+
+  Args:
+    future: The future whose result is passed to `fn`.
+    fn: The function to apply to the result.
+
+  Returns:
+    A new future resolved with `fn(future.result())`.
+  """
+  chained = Future()
+
+  def callback(done):
+    try:
+      chained.set_result(fn(done.result()))
+    except Exception as e:
+      chained.set_exception(e)
+
+  future.add_done_callback(callback)
+  return chained
+
+
+class WriteSpool(object):
+  """Sends writes to Daemo in order, retrying them until Daemo is reachable.
+  """
+
+  def __init__(self, location, header, retry_interval=5.0, verbose=False):
+    """Constructor for WriteSpool.
+
+    Args:
+      location: Path to the log file of the spool.
+      header: header to be sent along with the requests.
+      retry_interval: Seconds to wait before retrying after a connection
+        error.
+      verbose: Boolean that prints out helpful comments.
+    """
+    self.location = location
+    self.header = header
+    self.retry_interval = retry_interval
+    self.verbose = verbose
+    self._queue = deque()
+    self._lock = threading.Lock()
+    self._changed = threading.Condition(self._lock)
+    self._closed = False
+    pending = self._replay()
+    tmp = location + '.tmp'
+    with open(tmp, 'w') as f:
+      for entry in pending:
+        f.write(json.dumps(entry) + '\n')
+        self._queue.append((entry, Future()))
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp, location)
+    self._log = open(location, 'a')
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+
+  def _replay(self):
+    """Reads the writes from the log that were never completed.
+    """
+    if not os.path.exists(self.location):
+      return []
+    # Ordered so that the writes are sent again in the order they were made.
+    pending = OrderedDict()
+    with open(self.location, 'r') as f:
+      for line in f:
+        try:
+          entry = json.loads(line)
+        except ValueError:
+          # A partially written last line: the write was never acknowledged.
+          break
+        if entry['op'] == 'write':
+          pending[entry['key']] = entry
+        else:
+          pending.pop(entry['key'], None)
+    return list(pending.values())
+
+  def _append(self, entry):
+    """Durably appends an entry to the log.
+    """
+    self._log.write(json.dumps(entry) + '\n')
+    self._log.flush()
+    os.fsync(self._log.fileno())
+
+  def submit(self, method, url, data):
+    """Adds a write to the spool.
+
+    Args:
+      method: The HTTP method of the request.
+      url: The URL to send the request to.
+      data: The data accompanying the request.
+
+    Returns:
+      A future resolved with the response once the write is sent.
+    """
+    entry = {'op': 'write', 'key': uuid.uuid4().hex,
+             'method': method, 'url': url, 'data': data}
+    future = Future()
+    with self._lock:
+      if self._closed:
+        raise ValueError('The spool is closed.')
+      self._append(entry)
+      self._queue.append((entry, future))
+      self._changed.notify_all()
+    return future
+
+  def pending(self):
+    """Returns the number of writes that have not been sent yet.
+    """
+    with self._lock:
+      return len(self._queue)
+
+  def flush(self, timeout=None):
+    """Waits until all the writes have been sent.
+
+    Args:
+      timeout: Maximum number of seconds to wait.
+
+    Returns:
+      True if the spool is empty.
+    """
+    with self._lock:
+      return self._changed.wait_for(lambda: not self._queue, timeout=timeout)
+
+  def close(self, timeout=None):
+    """Stops the background thread, after trying to flush the spool.
+
+    Writes that are still pending stay in the log and are sent the next time
+    a spool is opened on the same file.
+
+    Args:
+      timeout: Maximum number of seconds to wait for the spool to flush.
+    """
+    self.flush(timeout=timeout)
+    with self._lock:
+      self._closed = True
+      self._changed.notify_all()
+    self._thread.join()
+    self._log.close()
+
+  def _run(self):
+    """Sends the writes in order until the spool is closed.
+    """
+    while True:
+      with self._lock:
+        self._changed.wait_for(lambda: self._queue or self._closed)
+        if self._closed:
+          return
+        entry, future = self._queue[0]
+      header = dict(self.header, **{'Idempotency-Key': entry['key']})
+      try:
+        # The same helpers as the direct calls of `Daemo`, so that a write
+        # behaves the same whether or not it was spooled.
+        if entry['method'] == 'DELETE':
+          resp = delete(entry['url'], header)
+        else:
+          resp = make_request(entry['method'], entry['url'], entry['data'],
+                              header, verbose=self.verbose)
+      except Exception as e:
+        if is_connect_error(e):
+          if self.verbose:
+            print('Daemo is unreachable, retrying in', self.retry_interval, e)
+          with self._lock:
+            self._changed.wait_for(lambda: self._closed,
+                                   timeout=self.retry_interval)
+          continue
+        resp, error = None, e
+      else:
+        error = None
+      with self._lock:
+        self._append({'op': 'done', 'key': entry['key']})
+        self._queue.popleft()
+        self._changed.notify_all()
+      if error is None:
+        future.set_result(resp)
+      else:
+        future.set_exception(error)
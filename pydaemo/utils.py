@@ -1,28 +1,153 @@
 """Contains helper functions for pydaemo.
+
+`requests`, `gzip` and `concurrent.futures` are imported on first use so that
+`import pydaemo` stays cheap for short-lived processes.
 """
 
 
 import json
 import os
-import requests
+import threading
+
+
+_transport = None
+
+
+def set_transport(transport):
+  """Sets the object through which all the HTTP requests are sent.
+
+  Args:
+    transport: An object with a `request(method, url, **kwargs)` method
+      behaving like `requests.request`, e.g. a cassette transport. None
+      restores the default of sending requests with `requests`.
+
+  Returns:
+    The previous transport.
+  """
+  global _transport
+  previous, _transport = _transport, transport
+  return previous
+
+
+def request(method, url, **kwargs):
+  """Sends an HTTP request through the current transport.
+
+  Args:
+    method: The HTTP method.
+    url: The URL to send the request to.
+    **kwargs: The arguments of `requests.request`.
+
+  Returns:
+    The response.
+  """
+  if _transport is not None:
+    return _transport.request(method, url, **kwargs)
+  # Imported here because requests is the most expensive dependency.
+  import requests
+  return requests.request(method, url, **kwargs)
+
 
+class Metrics(object):
+  """Thread-safe counters of the requests sent to Daemo.
+  """
 
-def create_header(credentials):
+  def __init__(self):
+    """Constructor for Metrics.
+    """
+    self._lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    """Sets all the counters back to zero.
+    """
+    with self._lock:
+      self.requests = 0
+      self.bytes_sent = 0
+      self.bytes_sent_uncompressed = 0
+      self.bytes_received = 0
+
+  def record(self, sent=0, sent_uncompressed=0, received=0, requests=1):
+    """Adds a request to the counters.
+
+    Args:
+      sent: Number of body bytes sent on the wire.
+      sent_uncompressed: Number of body bytes before compression.
+      received: Number of body bytes received on the wire.
+      requests: Number of requests made.
+    """
+    with self._lock:
+      self.requests += requests
+      self.bytes_sent += sent
+      self.bytes_sent_uncompressed += sent_uncompressed
+      self.bytes_received += received
+
+  def snapshot(self):
+    """Returns the current value of the counters.
+    """
+    with self._lock:
+      return {'requests': self.requests,
+              'bytes_sent': self.bytes_sent,
+              'bytes_sent_uncompressed': self.bytes_sent_uncompressed,
+              'bytes_received': self.bytes_received}
+
+
+metrics = Metrics()
+
+
+def create_header(credentials, compress=False):
   """Creates the header dictionary used in all API calls.
 
   Args:
     credentials: An object containing 'access_token'.
+    compress: Boolean that gzips the body of the requests if True.
 
   Returns:
     A dictionary to be used as the header for all API calls.
   """
-  return {'Content-Type': 'application/json',
-          'Authorization': 'Bearer ' + credentials['access_token']}
+  header = {'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Authorization': 'Bearer ' + credentials['access_token']}
+  if compress:
+    header['Content-Encoding'] = 'gzip'
+  return header
+
+
+# Servers (scheme and host) that refused a gzipped body.
+_uncompressed_servers = set()
+
+
+def _server(url):
+  """Returns the scheme and host of a URL.
+  """
+  from urllib.parse import urlsplit
+  parts = urlsplit(url)
+  return parts.scheme, parts.netloc
+
+
+def _refused_gzip(resp):
+  """Returns True if a response rejects a request for its gzipped body.
+
+  That is an HTTP 415, or an HTTP 400 complaining that the body could not be
+  decoded or parsed, e.g. the 'JSON parse error' of servers that do not
+  decompress request bodies. Other HTTP 400 are about the data itself.
+  """
+  if resp.status_code == 415:
+    return True
+  if resp.status_code != 400:
+    return False
+  text = resp.content.decode('utf-8', 'replace').lower()
+  return any(reason in text for reason in (
+      'parse error', 'decode', 'gzip', 'encoding'))
 
 
 def make_request(method, url, data, header, verbose=False):
   """Makes a request.
 
+  The body is gzipped when the header contains `Content-Encoding: gzip`. If
+  the server refuses a gzipped body (see `_refused_gzip`) but accepts the
+  same body uncompressed, bodies sent to that server are no longer
+  compressed.
+
   Args:
     url: The URL to sent the request to.
     data: The data accompanying the request.
@@ -37,17 +162,51 @@ def make_request(method, url, data, header, verbose=False):
   """
   if verbose:
     print(method, url, data)
-  if data is None:
-    resp = requests.request(method, url, headers=header)
-  else:
-    resp = requests.request(method, url, json=data, headers=header)
+  body = None
+  raw = b''
+  compressed = header.get('Content-Encoding') == 'gzip'
+  if compressed and (data is None or _server(url) in _uncompressed_servers):
+    compressed = False
+    header = {k: v for k, v in header.items() if k != 'Content-Encoding'}
+  if data is not None:
+    raw = json.dumps(data).encode('utf-8')
+    body = raw
+    if compressed:
+      import gzip
+      body = gzip.compress(raw)
+  resp = request(method, url, data=body, headers=header)
+  metrics.record(sent=len(body or b''), sent_uncompressed=len(raw),
+                 received=_wire_size(resp))
+  if compressed and _refused_gzip(resp):
+    header = {k: v for k, v in header.items() if k != 'Content-Encoding'}
+    resp = request(method, url, data=raw, headers=header)
+    metrics.record(sent=len(raw), sent_uncompressed=len(raw),
+                   received=_wire_size(resp))
+    if resp.ok:
+      if verbose:
+        print('gzipped bodies are not accepted, sending them uncompressed')
+      _uncompressed_servers.add(_server(url))
   if not resp.ok:
     if verbose:
       print(resp.content)
     resp.raise_for_status()
+  if not resp.content:
+    return None
   return json.loads(resp.content)
 
 
+def _wire_size(resp):
+  """Returns the number of body bytes of a read response, before decoding.
+  """
+  raw = getattr(resp, 'raw', None)
+  if raw is not None and hasattr(raw, 'tell'):
+    # urllib3 counts the bytes it read from the socket, i.e. still encoded.
+    return raw.tell()
+  if resp.headers.get('Content-Length') is not None:
+    return int(resp.headers['Content-Length'])
+  return len(resp.content)
+
+
 def delete(url, header):
   """Makes a DELETE request.
 
@@ -58,7 +217,8 @@ def delete(url, header):
   Raises:
     HTTPError is the request fails.
   """
-  requests.request('DELETE', url, headers=header)
+  resp = request('DELETE', url, headers=header)
+  metrics.record(received=_wire_size(resp))
 
 
 def post(url, data, header, verbose=False):
@@ -123,6 +283,112 @@ def get_from_pages(url, header, max_count=None, verbose=False):
   return results
 
 
+def iter_pages(url, header, verbose=False):
+  """Lazily gets the results of a paginated endpoint, one page at a time.
+
+  Args:
+    url: The URL to get from.
+    header: header to be sent along with the request.
+    verbose: Boolean that prints out helpful comments.
+
+  Raises:
+    HTTPError is the request fails.
+
+  Returns:
+    A generator of results. The next page is only requested once all the
+    results of the previous one have been consumed.
+  """
+  while url is not None:
+    resp = get(url, header, verbose=verbose)
+    url = resp['next']
+    yield from resp['results']
+
+
+def resolve(value):
+  """Waits for the result of a write if it was spooled.
+
+  Args:
+    value: The value returned by a Daemo call that modifies a resource.
+
+  Returns:
+    The value, or the result of the future when the write was spooled.
+  """
+  from concurrent.futures import Future
+  if isinstance(value, Future):
+    return value.result()
+  return value
+
+
+def json_size(item):
+  """Returns the size in bytes of an item serialized as JSON.
+  """
+  return len(json.dumps(item).encode('utf-8'))
+
+
+def bounded_map(fn, items, max_workers=8, max_bytes=None, size=json_size):
+  """Calls a function on every item concurrently, with bounded memory.
+
+  At most `2 * max_workers` items are read from `items` ahead of completion,
+  so `items` can be a generator over an arbitrarily large input. When
+  `max_bytes` is set, the window is also limited to items whose total size
+  fits in that budget; an item larger than the budget is sent on its own.
+
+  Args:
+    fn: The function to call on each item.
+    items: An iterable of items.
+    max_workers: Maximum number of concurrent calls.
+    max_bytes: Optional maximum total size of the items in flight.
+    size: The function returning the size of an item in bytes.
+
+  Returns:
+    A generator of (item, future) pairs in the order the calls complete.
+  """
+  from concurrent.futures import FIRST_COMPLETED
+  from concurrent.futures import ThreadPoolExecutor
+  from concurrent.futures import wait
+  max_in_flight = 2 * max_workers
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    in_flight = {}
+    sizes = {}
+    in_flight_bytes = 0
+    for item in items:
+      item_size = size(item) if max_bytes is not None else 0
+      while in_flight and (
+          len(in_flight) >= max_in_flight or
+          (max_bytes is not None and in_flight_bytes + item_size > max_bytes)):
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+          in_flight_bytes -= sizes.pop(future)
+          yield in_flight.pop(future), future
+      future = executor.submit(fn, item)
+      in_flight[future] = item
+      sizes[future] = item_size
+      in_flight_bytes += item_size
+    while in_flight:
+      done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+      for future in done:
+        sizes.pop(future)
+        yield in_flight.pop(future), future
+
+
+def get_template_id(project):
+  """Returns the id of the template used by a project.
+
+  Args:
+    project: A project resource, as returned by `Daemo.get_project` or
+      `Daemo.create_project`.
+
+  Returns:
+    The id of the template.
+  """
+  if 'template_id' in project:
+    return project['template_id']
+  template = project['template']
+  if isinstance(template, dict):
+    return template['id']
+  return template
+
+
 def load_credentials(location):
   """Loads the credentials.
 
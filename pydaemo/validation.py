@@ -0,0 +1,80 @@
+"""Checks task data against the `{{placeholders}}` used by a template.
+
+Template items can reference the data of a task with placeholders such as
+`src='{{url}}'` or `question_value='{{dynamic_question}}'`. A task whose data
+misses one of them is shown to workers with a broken item, so we reject such
+rows before sending them to Daemo.
+"""
+
+
+import re
+
+
+PLACEHOLDER = re.compile(r'{{\s*([^{}\s]+)\s*}}')
+
+
+def find_placeholders(items):
+  """Finds the placeholders used anywhere in a list of template items.
+
+  Args:
+    items: A list of template item resources.
+
+  Returns:
+    A frozenset of placeholder names.
+  """
+  placeholders = set()
+  stack = [items]
+  while stack:
+    value = stack.pop()
+    if isinstance(value, dict):
+      stack.extend(value.values())
+    elif isinstance(value, (list, tuple)):
+      stack.extend(value)
+    elif isinstance(value, str) and '{{' in value:
+      placeholders.update(PLACEHOLDER.findall(value))
+  return frozenset(placeholders)
+
+
+class TemplateValidator(object):
+  """Validates task data against the placeholders of a template.
+
+  The placeholders are extracted once, so validating a row is a single set
+  inclusion test.
+  """
+
+  def __init__(self, items):
+    """Constructor for TemplateValidator.
+
+    Args:
+      items: A list of template item resources.
+    """
+    self.placeholders = find_placeholders(items)
+
+  def missing(self, data):
+    """Returns the placeholders that are missing from the data of a task.
+
+    Args:
+      data: The data associated with a task.
+
+    Returns:
+      A sorted list of missing placeholder names.
+    """
+    if self.placeholders <= data.keys():
+      return []
+    return sorted(self.placeholders - data.keys())
+
+  def validate(self, data):
+    """Checks the data of a task.
+
+    Args:
+      data: The data associated with a task.
+
+    Raises:
+      ValueError if the data is missing a placeholder of the template.
+    """
+    if not isinstance(data, dict):
+      raise TypeError('task \'data\' needs to be a dictionary.')
+    if self.placeholders <= data.keys():
+      return
+    raise ValueError('task data is missing template placeholders: {}'.format(
+        ', '.join(self.missing(data))))
@@ -1,3 +1,5 @@
+import sys
+
 from setuptools import setup
 from setuptools import find_packages
 
@@ -20,6 +22,9 @@ setup(name='pydaemo',
       packages=['pydaemo'],
       zip_safe=False,
       keywords='daemo python api',
+      entry_points={
+          'console_scripts': ['pydaemo=pydaemo.cli:main'],
+      },
       classifiers=[
           'Development Status :: 3 - Alpha',
           'Intended Audience :: Developers',
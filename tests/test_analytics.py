@@ -0,0 +1,37 @@
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import numpy as np
+
+from pydaemo.analytics import Throughput
+from pydaemo.analytics import to_seconds
+
+
+def test_to_seconds_applies_utc_offsets():
+  expected = datetime(2020, 1, 1, 8, tzinfo=timezone.utc).timestamp()
+  seconds = to_seconds(['2020-01-01T08:00:00Z', '2020-01-01T10:00:00+02:00',
+                        '2020-01-01T03:00:00.5-05:00',
+                        datetime(2020, 1, 1, 9,
+                                 tzinfo=timezone(timedelta(hours=1))),
+                        None, ''])
+  assert np.allclose(seconds[:4] - expected, [0, 0, 0.5, 0])
+  assert np.isnan(seconds[4:]).all()
+  assert to_seconds([]).size == 0
+
+
+def test_throughput_skips_missing_ids():
+  assignments = [
+      {'task': 1, 'worker': None, 'created_at': '2020-01-01T00:00:00Z',
+       'submitted_at': '2020-01-01T00:01:00Z'},
+      {'task': None, 'worker': 3, 'created_at': '2020-01-01T00:00:00Z',
+       'submitted_at': '2020-01-01T00:02:00Z'},
+      {'task': 1, 'worker': 3, 'created_at': '2020-01-01T00:00:00Z',
+       'submitted_at': '2020-01-01T00:03:00Z'}]
+  throughput = Throughput(assignments)
+  tasks, turnaround = throughput.turnaround()
+  assert tasks.tolist() == [1] and turnaround.tolist() == [180.0]
+  speed = throughput.worker_speed()
+  assert speed['worker'].tolist() == [3]
+  assert speed['count'].tolist() == [2]
+  assert speed['median'].tolist() == [150.0]
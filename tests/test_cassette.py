@@ -0,0 +1,51 @@
+import json
+
+import pytest
+import requests
+
+from pydaemo import cli
+from pydaemo.cassette import CassetteResponse
+from pydaemo.cassette import record
+from pydaemo.cassette import replay
+from pydaemo.utils import post
+
+
+def _respond(method, url, **kwargs):
+  if url.endswith('/api/oauth2-ng/token/'):
+    body = {'access_token': 'secret', 'refresh_token': 'secret2',
+            'expires_in': 36000}
+  else:
+    body = {'id': 1, 'data': json.loads(kwargs['data'])}
+  content = json.dumps(body).encode('utf-8')
+  return CassetteResponse(method, url, 200,
+                          {'Content-Length': str(len(content))}, content)
+
+
+def test_replay_serves_recorded_responses(tmpdir, monkeypatch):
+  location = str(tmpdir.join('cassette'))
+  monkeypatch.setattr(requests, 'request', _respond)
+  with record(location):
+    recorded = post('https://daemo/v1/tasks/', {'n': 1}, {})
+  with replay(location) as transport:
+    assert post('https://daemo/v1/tasks/', {'n': 1}, {}) == recorded
+    assert transport.remaining() == 0
+    with pytest.raises(LookupError):
+      post('https://daemo/v1/tasks/', {'n': 1}, {})
+
+
+def test_record_redacts_tokens(tmpdir, monkeypatch):
+  location = str(tmpdir.join('cassette'))
+  monkeypatch.setattr(requests, 'request', _respond)
+  data = {'grant_type': 'refresh_token', 'refresh_token': 'secret2'}
+  with record(location):
+    assert post('https://daemo/api/oauth2-ng/token/', data, {})[
+        'access_token'] == 'secret'
+  with replay(location):
+    assert post('https://daemo/api/oauth2-ng/token/', data, {}) == {
+        'access_token': 'REDACTED', 'refresh_token': 'REDACTED',
+        'expires_in': 36000}
+
+
+def test_cli_refuses_to_update_credentials_from_a_cassette():
+  with pytest.raises(SystemExit):
+    cli.main(['stats', '1', '--replay', 'cassette', '--update-credentials'])
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from pydaemo import cli
+from pydaemo.cassette import CassetteResponse
+from pydaemo.utils import iter_pages
+from pydaemo.utils import set_transport
+
+
+class Api(object):
+  """Serves two pages of tasks and one result per task.
+  """
+
+  def __init__(self):
+    self.urls = []
+
+  def request(self, method, url, **kwargs):
+    self.urls.append(url)
+    if '/v1/tasks/?project_id=7' in url:
+      second = url.endswith('&page=2')
+      body = {'count': 4, 'next': None if second else url + '&page=2',
+              'results': [{'id': 3}, {'id': 4}] if second
+                         else [{'id': 1}, {'id': 2}]}
+    else:
+      task_id = int(url.split('/v1/tasks/')[1].split('/')[0])
+      body = {'count': 1, 'next': None,
+              'results': [{'id': task_id * 10, 'result': 'cat'}]}
+    content = json.dumps(body).encode('utf-8')
+    return CassetteResponse(method, url, 200,
+                            {'Content-Length': str(len(content))}, content)
+
+
+@pytest.fixture
+def api():
+  api = Api()
+  previous = set_transport(api)
+  yield api
+  set_transport(previous)
+
+
+@pytest.fixture
+def credentials(tmpdir):
+  location = tmpdir.join('credentials.json')
+  location.write(json.dumps({'client_id': 'id', 'access_token': 'token',
+                             'refresh_token': 'refresh'}))
+  return str(location)
+
+
+def test_iter_pages_is_lazy(api):
+  tasks = iter_pages('https://daemo/v1/tasks/?project_id=7', {})
+  assert [next(tasks), next(tasks)] == [{'id': 1}, {'id': 2}]
+  assert len(api.urls) == 1
+  assert list(tasks) == [{'id': 3}, {'id': 4}]
+  assert len(api.urls) == 2
+
+
+def test_harvest_takes_flags_after_the_command(api, credentials, tmpdir):
+  output = str(tmpdir.join('results.jsonl'))
+  cli.main(['harvest', '7', '--output', output, '--concurrency', '2',
+            '--credentials', credentials])
+  with open(output, 'r') as f:
+    rows = [json.loads(line) for line in f]
+  assert sorted(row['task_id'] for row in rows) == [1, 2, 3, 4]
+  assert all(row['result']['id'] == row['task_id'] * 10 for row in rows)
@@ -0,0 +1,82 @@
+import pytest
+
+from pydaemo.clone import clone_project
+
+
+class Client(object):
+  """An in-memory Daemo client with the calls used by clone_project.
+  """
+
+  def __init__(self, drop_items=False):
+    self.drop_items = drop_items
+    self.projects = {}
+    self.templates = {}
+    self.tasks = {}
+
+  def get_project(self, project_id, verbose=False):
+    return self.projects[project_id]
+
+  def get_template(self, template_id, verbose=False):
+    return {'id': template_id, 'name': 'template'}
+
+  def get_template_items(self, template_id, verbose=False):
+    return self.templates[template_id]
+
+  def get_all_tasks(self, project_id, verbose=False):
+    return [task for task in self.tasks.values()
+            if task['project'] == project_id]
+
+  def create_project(self, name, price, template_name, repetition=1,
+                     timeout=120, template_items=None, verbose=False):
+    project_id = len(self.projects) + 100
+    template_id = project_id + 1
+    self.projects[project_id] = {'id': project_id, 'name': name,
+                                 'price': price, 'template': template_id}
+    items = [] if self.drop_items else template_items
+    self.templates[template_id] = [dict(item, id=template_id * 10 + i)
+                                   for i, item in enumerate(items)]
+    return {'id': project_id, 'template_id': template_id}
+
+  def create_task(self, project_id, data, price=None, verbose=False):
+    task_id = len(self.tasks) + 1000
+    self.tasks[task_id] = {'id': task_id, 'project': project_id,
+                           'data': data}
+    return task_id
+
+
+def _source():
+  client = Client()
+  client.projects[1] = {'id': 1, 'name': 'p', 'price': 1, 'template': 2}
+  client.templates[2] = [{'id': 7, 'name': 'image'},
+                         {'id': 5, 'name': 'caption', 'predecessor': 7}]
+  client.tasks = {i: {'id': i, 'project': 1, 'data': {'n': i}}
+                  for i in range(10)}
+  return client
+
+
+def test_clone_project_maps_items_and_tasks(tmpdir):
+  src, dst = _source(), Client()
+  mapping = clone_project(src, dst, 1, state_file=str(tmpdir.join('s')))
+  new_items = dst.templates[mapping['template']['2']]
+  assert [item['name'] for item in new_items] == ['image', 'caption']
+  assert mapping['template_items'] == {'7': new_items[0]['id'],
+                                       '5': new_items[1]['id']}
+  assert len(mapping['tasks']) == 10 and mapping['errors'] == {}
+
+
+def test_clone_project_resumes(tmpdir):
+  src, dst = _source(), Client()
+  state_file = str(tmpdir.join('s'))
+  first = clone_project(src, dst, 1, state_file=state_file)
+  src.tasks[10] = {'id': 10, 'project': 1, 'data': {'n': 10}}
+  second = clone_project(src, dst, 1, state_file=state_file)
+  assert len(dst.projects) == 1
+  assert len(dst.tasks) == 11
+  assert second['tasks'] == dict(first['tasks'], **{'10': 1010})
+  with pytest.raises(ValueError):
+    clone_project(src, dst, 2, state_file=state_file)
+
+
+def test_clone_project_checks_template_items():
+  with pytest.raises(ValueError):
+    clone_project(_source(), Client(drop_items=True), 1)
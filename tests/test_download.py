@@ -0,0 +1,143 @@
+import hashlib
+import os
+
+import pytest
+
+from pydaemo.cassette import CassetteResponse
+from pydaemo.download import ArtifactStore
+from pydaemo.download import download_artifacts
+from pydaemo.download import download_file
+from pydaemo.download import find_file_urls
+from pydaemo.utils import set_transport
+
+
+class FileServer(object):
+  """Serves files, honouring Range and If-Range like an HTTP server.
+  """
+
+  def __init__(self, files):
+    self.files = files
+    self.requests = []
+
+  def request(self, method, url, headers=None, **kwargs):
+    headers = headers or {}
+    self.requests.append((method, url, headers))
+    content, etag = self.files[url]
+    response_headers = {'ETag': etag}
+    range_header = headers.get('Range')
+    if range_header is not None and headers.get('If-Range') in (None, etag):
+      offset = int(range_header[len('bytes='):-1])
+      if offset >= len(content):
+        return CassetteResponse(method, url, 416, response_headers, b'')
+      content = content[offset:]
+      status = 206
+    else:
+      status = 200
+    response_headers['Content-Length'] = str(len(content))
+    return CassetteResponse(method, url, status, response_headers, content)
+
+
+@pytest.fixture
+def server():
+  server = FileServer({})
+  previous = set_transport(server)
+  yield server
+  set_transport(previous)
+
+
+def _interrupt(store, server, url, size):
+  """Leaves a partial download of the first `size` bytes of a file.
+  """
+  content, etag = server.files[url]
+  with open(store.partial_path(url), 'wb') as f:
+    f.write(content[:size])
+  store.save_validator(url, {'ETag': etag})
+
+
+def test_download_file_stores_by_digest(tmpdir, server):
+  url = 'https://files.example.com/a.png'
+  server.files[url] = (b'a' * 1000, '"v1"')
+  store = ArtifactStore(str(tmpdir))
+  entry = download_file(url, store)
+  assert entry['sha256'] == hashlib.sha256(b'a' * 1000).hexdigest()
+  assert entry['size'] == 1000
+  with open(entry['path'], 'rb') as f:
+    assert f.read() == b'a' * 1000
+  assert os.listdir(store.partial) == []
+  assert download_file(url, store) == entry
+  assert len(server.requests) == 1
+
+
+def test_download_file_resumes_unchanged_file(tmpdir, server):
+  url = 'https://files.example.com/a.png'
+  content = bytes(range(256)) * 4
+  server.files[url] = (content, '"v1"')
+  store = ArtifactStore(str(tmpdir))
+  _interrupt(store, server, url, 300)
+  entry = download_file(url, store)
+  _, _, headers = server.requests[-1]
+  assert headers['Range'] == 'bytes=300-'
+  assert headers['If-Range'] == '"v1"'
+  with open(entry['path'], 'rb') as f:
+    assert f.read() == content
+
+
+def test_download_file_restarts_changed_file(tmpdir, server):
+  url = 'https://files.example.com/a.png'
+  server.files[url] = (b'old' * 100, '"v1"')
+  store = ArtifactStore(str(tmpdir))
+  _interrupt(store, server, url, 150)
+  server.files[url] = (b'new' * 100, '"v2"')
+  entry = download_file(url, store)
+  assert entry['sha256'] == hashlib.sha256(b'new' * 100).hexdigest()
+  with open(entry['path'], 'rb') as f:
+    assert f.read() == b'new' * 100
+
+
+def test_download_file_restarts_without_validator(tmpdir, server):
+  url = 'https://files.example.com/a.png'
+  server.files[url] = (b'b' * 100, '"v1"')
+  store = ArtifactStore(str(tmpdir))
+  with open(store.partial_path(url), 'wb') as f:
+    f.write(b'x' * 50)
+  entry = download_file(url, store)
+  _, _, headers = server.requests[-1]
+  assert 'Range' not in headers
+  with open(entry['path'], 'rb') as f:
+    assert f.read() == b'b' * 100
+
+
+def test_download_file_checks_sha256(tmpdir, server):
+  url = 'https://files.example.com/a.png'
+  server.files[url] = (b'c' * 10, '"v1"')
+  store = ArtifactStore(str(tmpdir))
+  with pytest.raises(IOError):
+    download_file(url, store, sha256='0' * 64)
+  assert os.listdir(store.partial) == []
+
+
+def test_find_file_urls_only_reads_file_uploads():
+  items = [{'id': 1, 'type': 'file_upload'}, {'id': 2, 'type': 'text'}]
+  results = [{'template_item': 1, 'result': '/media/a.png'},
+             {'template_item': 2, 'result': 'https://evil.example.com/x'},
+             {'template_item': {'id': 3, 'type': 'file_upload'},
+              'result': ['https://files.example.com/b.png']}]
+  assert find_file_urls(results, template_items=items,
+                        base_url='https://daemo.example.com') == [
+                            'https://daemo.example.com/media/a.png',
+                            'https://files.example.com/b.png']
+
+
+def test_download_artifacts_keeps_header_on_daemo(tmpdir, server):
+  daemo_url = 'https://daemo.example.com/media/a.png'
+  other_url = 'https://files.example.com/b.png'
+  server.files[daemo_url] = (b'a', '"a"')
+  server.files[other_url] = (b'b', '"b"')
+  header = {'Authorization': 'Bearer token'}
+  downloaded = download_artifacts([daemo_url, other_url], str(tmpdir),
+                                  header=header,
+                                  auth_url='https://daemo.example.com')
+  assert all(isinstance(entry, dict) for entry in downloaded.values())
+  sent = {url: headers for _, url, headers in server.requests}
+  assert sent[daemo_url]['Authorization'] == 'Bearer token'
+  assert 'Authorization' not in sent[other_url]
@@ -0,0 +1,65 @@
+from pydaemo.qc import QualityControl
+from pydaemo.qc import poll_results
+
+
+class Client(object):
+  """Serves a different list of results for a task at every poll.
+  """
+
+  def __init__(self, polls):
+    self.polls = polls
+    self.calls = {task_id: 0 for task_id in polls}
+    self.decisions = []
+
+  def get_task_results(self, task_id, verbose=False):
+    polls = self.polls[task_id]
+    results = polls[min(self.calls[task_id], len(polls) - 1)]
+    self.calls[task_id] += 1
+    return results
+
+  def approve_assignment(self, assignment_id, verbose=False):
+    self.decisions.append((assignment_id, 'approve'))
+
+  def reject_assignment(self, assignment_id, verbose=False):
+    self.decisions.append((assignment_id, 'reject'))
+
+  def return_assignment(self, assignment_id, verbose=False):
+    self.decisions.append((assignment_id, 'return'))
+
+
+def _result(result_id, task, worker, answer):
+  return {'id': result_id, 'assignment': result_id, 'task': task,
+          'worker': worker, 'result': answer}
+
+
+def test_poll_results_stops_after_timeout():
+  client = Client({1: [[]]})
+  assert list(poll_results(client, [1], interval=0, timeout=0)) == []
+  assert client.calls[1] == 1
+
+
+def test_quality_control_waits_for_replacements_and_revisions():
+  wrong_gold = _result(1, 'gold', 'w', 'dog')
+  bad = _result(2, 'task', 'w', 'x')
+  good_gold = _result(3, 'gold', 'v', 'cat')
+  returned = _result(4, 'task', 'v', 'y')
+  revised = _result(4, 'task', 'v', 'z')
+  client = Client({
+      'gold': [[wrong_gold], [wrong_gold, good_gold]],
+      'task': [[bad], [bad, returned], [bad, revised]]})
+  # Worker v is right on their only gold task: their accuracy is 2/3, so
+  # they are returned until the threshold is lowered for the revision.
+  qc = QualityControl(client, gold={'gold': 'cat'}, min_gold=1,
+                      approve_threshold=2.0, batch_size=1)
+
+  def run():
+    for result in poll_results(client, ['gold', 'task'], interval=0,
+                               timeout=5, redone=qc.redone):
+      if result['id'] == 4 and result['result'] == 'z':
+        qc.approve_threshold = 0.6
+      yield result
+
+  stats = qc.run(run())
+  assert client.decisions == [(1, 'reject'), (2, 'reject'), (3, 'approve'),
+                              (4, 'return'), (4, 'approve')]
+  assert stats['processed'] == 5 and stats['undecided'] == []
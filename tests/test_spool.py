@@ -0,0 +1,138 @@
+import json
+import socket
+
+import pytest
+import requests
+
+from pydaemo.cassette import CassetteResponse
+from pydaemo.spool import WriteSpool
+from pydaemo.spool import is_connect_error
+from pydaemo.utils import set_transport
+
+
+class Server(object):
+  """Answers every request with the same status and records the requests.
+  """
+
+  def __init__(self, status=200):
+    self.status = status
+    self.requests = []
+
+  def request(self, method, url, data=None, headers=None, **kwargs):
+    self.requests.append((method, url, data, headers))
+    body = json.dumps({'id': len(self.requests)}).encode('utf-8')
+    return CassetteResponse(method, url, self.status,
+                            {'Content-Length': str(len(body))}, body)
+
+
+@pytest.fixture
+def server():
+  server = Server()
+  previous = set_transport(server)
+  yield server
+  set_transport(previous)
+
+
+def _closed_url():
+  """Returns the URL of a local port nothing listens on.
+  """
+  sock = socket.socket()
+  sock.bind(('127.0.0.1', 0))
+  port = sock.getsockname()[1]
+  sock.close()
+  return 'http://127.0.0.1:{}/v1/tasks/'.format(port)
+
+
+def _pending(location):
+  """Returns the keys of the writes in a log that are not done.
+  """
+  pending = []
+  with open(location, 'r') as f:
+    for line in f:
+      entry = json.loads(line)
+      if entry['op'] == 'write':
+        pending.append(entry['key'])
+      else:
+        pending.remove(entry['key'])
+  return pending
+
+
+def test_is_connect_error():
+  with pytest.raises(requests.exceptions.ConnectionError) as error:
+    requests.post(_closed_url(), data=b'{}', timeout=1)
+  assert is_connect_error(error.value)
+  assert not is_connect_error(requests.exceptions.ReadTimeout())
+  assert not is_connect_error(ValueError())
+
+
+def test_spool_sends_writes(tmpdir, server):
+  location = str(tmpdir.join('spool.log'))
+  spool = WriteSpool(location, {'Authorization': 'Bearer token'})
+  futures = [spool.submit('POST', 'https://daemo/v1/tasks/', {'n': n})
+             for n in range(5)]
+  assert spool.flush(timeout=5)
+  assert [future.result()['id'] for future in futures] == [1, 2, 3, 4, 5]
+  assert [json.loads(data)['n'] for _, _, data, _ in server.requests] == [
+      0, 1, 2, 3, 4]
+  keys = [headers['Idempotency-Key'] for _, _, _, headers in server.requests]
+  assert len(set(keys)) == 5
+  spool.close()
+  assert _pending(location) == []
+
+
+def test_spool_replays_pending_writes_in_order(tmpdir, server):
+  location = str(tmpdir.join('spool.log'))
+  entries = [{'op': 'write', 'key': key, 'method': 'POST',
+              'url': 'https://daemo/v1/tasks/', 'data': {'key': key}}
+             for key in 'zyxwv']
+  with open(location, 'w') as f:
+    for entry in entries:
+      f.write(json.dumps(entry) + '\n')
+    f.write(json.dumps({'op': 'done', 'key': 'y'}) + '\n')
+    # The last line was cut short by a crash.
+    f.write('{"op": "write", "key": "u"')
+  spool = WriteSpool(location, {})
+  assert spool.flush(timeout=5)
+  spool.close()
+  assert [headers['Idempotency-Key']
+          for _, _, _, headers in server.requests] == ['z', 'x', 'w', 'v']
+  assert _pending(location) == []
+
+
+def test_spool_retries_connect_errors_across_restarts(tmpdir):
+  location = str(tmpdir.join('spool.log'))
+  spool = WriteSpool(location, {}, retry_interval=0.05)
+  future = spool.submit('POST', _closed_url(), {'n': 1})
+  assert not spool.flush(timeout=0.3)
+  assert not future.done()
+  spool.close(timeout=0)
+  assert len(_pending(location)) == 1
+
+  server = Server()
+  previous = set_transport(server)
+  try:
+    spool = WriteSpool(location, {})
+    assert spool.flush(timeout=5)
+    spool.close()
+  finally:
+    set_transport(previous)
+  assert len(server.requests) == 1
+  assert _pending(location) == []
+
+
+def test_spool_fails_other_errors(tmpdir, server):
+  server.status = 500
+  spool = WriteSpool(str(tmpdir.join('spool.log')), {})
+  future = spool.submit('POST', 'https://daemo/v1/tasks/', {'n': 1})
+  assert spool.flush(timeout=5)
+  assert isinstance(future.exception(), requests.exceptions.HTTPError)
+  assert len(server.requests) == 1
+  spool.close()
+
+
+def test_spool_deletes_like_direct_calls(tmpdir, server):
+  server.status = 404
+  spool = WriteSpool(str(tmpdir.join('spool.log')), {})
+  future = spool.submit('DELETE', 'https://daemo/v1/tasks/1/', None)
+  assert future.result(timeout=5) is None
+  spool.close()
@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from pydaemo import utils
+from pydaemo.cassette import CassetteResponse
+from pydaemo.utils import bounded_map
+from pydaemo.utils import create_header
+from pydaemo.utils import post
+from pydaemo.utils import set_transport
+
+
+def test_bounded_map_returns_every_item():
+  results = dict((item, future.result()) for item, future in
+                 bounded_map(lambda item: item * 2, range(100), max_workers=4))
+  assert results == {item: item * 2 for item in range(100)}
+
+
+def test_bounded_map_reads_items_lazily():
+  read = []
+  started = threading.Event()
+
+  def items():
+    for item in range(1000):
+      read.append(item)
+      yield item
+
+  def fn(item):
+    started.wait()
+    return item
+
+  pairs = bounded_map(fn, items(), max_workers=2)
+  time.sleep(0.1)
+  assert read == []
+  started.set()
+  item, future = next(pairs)
+  assert len(read) <= 2 * 2 + 1
+  pairs.close()
+
+
+def test_bounded_map_limits_bytes_in_flight():
+  lock = threading.Lock()
+  in_flight = []
+  peak = []
+
+  def fn(item):
+    with lock:
+      in_flight.append(item)
+      peak.append(sum(len(item) for item in in_flight))
+    time.sleep(0.01)
+    with lock:
+      in_flight.remove(item)
+
+  items = ['x' * size for size in (40, 40, 40, 150, 10, 10, 10)]
+  for _, future in bounded_map(fn, items, max_workers=8, max_bytes=100,
+                               size=len):
+    future.result()
+  # An item larger than the budget is sent on its own.
+  assert max(peak) == 150
+  assert all(total <= 100 for total in peak if total != 150)
+
+
+def test_bounded_map_keeps_exceptions_in_futures():
+  def fn(item):
+    if item == 3:
+      raise ValueError(item)
+    return item
+
+  failed = [item for item, future in bounded_map(fn, range(5))
+            if future.exception() is not None]
+  assert failed == [3]
+
+
+class GzipServer(object):
+  """Answers like a server that cannot decompress request bodies, and
+  rejects the data of the requests sent to /bad/.
+  """
+
+  def __init__(self):
+    self.requests = []
+
+  def request(self, method, url, data=None, headers=None, **kwargs):
+    self.requests.append((url, headers.get('Content-Encoding')))
+    if url.endswith('/bad/'):
+      body, status = {'name': ['This field is required.']}, 400
+    elif headers.get('Content-Encoding') == 'gzip':
+      body = {'detail': "JSON parse error - 'utf-8' codec can't decode"}
+      status = 400
+    else:
+      body, status = {'id': 1}, 201
+    content = json.dumps(body).encode('utf-8')
+    return CassetteResponse(method, url, status,
+                            {'Content-Length': str(len(content))}, content)
+
+
+def test_make_request_falls_back_to_uncompressed_bodies(monkeypatch):
+  monkeypatch.setattr(utils, '_uncompressed_servers', set())
+  server = GzipServer()
+  previous = set_transport(server)
+  try:
+    header = create_header({'access_token': 'token'}, compress=True)
+    assert post('https://a.example.com/v1/tasks/', {'n': 1}, header) == {
+        'id': 1}
+    assert post('https://a.example.com/v1/tasks/', {'n': 2}, header) == {
+        'id': 1}
+    assert server.requests == [('https://a.example.com/v1/tasks/', 'gzip'),
+                               ('https://a.example.com/v1/tasks/', None),
+                               ('https://a.example.com/v1/tasks/', None)]
+  finally:
+    set_transport(previous)
+
+
+def test_make_request_sends_invalid_writes_once(monkeypatch):
+  monkeypatch.setattr(utils, '_uncompressed_servers', set())
+  server = GzipServer()
+  previous = set_transport(server)
+  try:
+    header = create_header({'access_token': 'token'}, compress=True)
+    with pytest.raises(requests.exceptions.HTTPError):
+      post('https://a.example.com/bad/', {'n': 1}, header)
+    assert len(server.requests) == 1
+  finally:
+    set_transport(previous)